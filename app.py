@@ -1,19 +1,39 @@
 # Part 1: Imports and Initial Setup
 import streamlit as st
-from openai import OpenAI
-import time
-import qrcode
-from io import BytesIO
 import base64
-from PIL import Image
-import requests
-import hashlib
-import sqlite3
-from datetime import datetime, timedelta  # Updated import
+from datetime import datetime
 import os
 import logging
-import extra_streamlit_components as stx
-import json
+import uuid
+
+from weart import settings
+from weart.db import get_db
+from weart.catalog import hobbies, colors, styles, moods, filters
+from weart.users import create_user as _create_user, authenticate
+from weart.sessions import get_sessions
+from weart.state import get_state
+from weart.generation import (
+    GENERATION_STAGES, create_qr_code, create_personalized_prompt,
+    create_georgian_summary, run_generation_job, coalesced,
+    IMAGE_TIERS, image_plan, set_image_plan, schedule_upgrade, upgrade_in_flight,
+    take_pooled, start_pool_warmer
+)
+from weart.clients import get_client, get_client_registry
+from weart.image_store import get_image_store, static_url
+from weart.qr_codes import cache_stats as qr_cache_stats
+from weart.shortlinks import start_link_server
+from weart.history import get_history
+from weart.image_pool import get_image_pool
+from weart.singleflight import get_singleflight, request_key
+from weart.prefetch import PromptPrefetcher
+from weart.ratelimit import current_session
+from weart.breaker import breaker_stats
+from weart.metrics import REGISTRY, start_metrics_server
+from weart.jobs import JobQueue, ACTIVE_STATUSES
+from weart.prompt_cache import get_prompt_cache
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_SESSION_COOKIE = 'session_data'
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,86 +60,69 @@ def handle_error(func):
             return None
     return wrapper
 
+def is_auth_error(error):
+    """Whether OpenAI rejected the user's API key"""
+    import openai
+    return isinstance(error, openai.AuthenticationError)
+
 # Cookie Manager setup
+_cookie_manager = None
+
 def get_cookie_manager():
-    return stx.CookieManager()
+    """Return this run's cookie component; each instance is another browser round trip"""
+    global _cookie_manager
+    if _cookie_manager is None:
+        import extra_streamlit_components as stx
+        _cookie_manager = stx.CookieManager()
+    return _cookie_manager
+
+def delete_cookie(cookie_manager, name, key="delete"):
+    # The component deletes the cookie in the browser even when this run has not read it yet
+    try:
+        cookie_manager.delete(name, key=key)
+    except KeyError:
+        pass
 
 # Database setup
-@handle_error
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('users.db', check_same_thread=False)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password_hash TEXT NOT NULL,
-            api_key TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Open the pool and run migrations once per process, not on every rerun"""
+    get_db()
     logger.info("Database initialized successfully")
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 @handle_error
 def create_user(username, password, api_key):
-    conn = sqlite3.connect('users.db', check_same_thread=False)
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO users (username, password_hash, api_key) VALUES (?, ?, ?)",
-            (username, hash_password(password), api_key)
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    return _create_user(username, password, api_key)
 
 @handle_error
 def verify_user(username, password):
-    conn = sqlite3.connect('users.db', check_same_thread=False)
-    c = conn.cursor()
-    try:
-        c.execute(
-            "SELECT password_hash, api_key FROM users WHERE username = ?",
-            (username,)
-        )
-        result = c.fetchone()
-        
-        if result and result[0] == hash_password(password):
-            api_key = result[1]
-            save_session(username, api_key)
-            return api_key
-        return None
-    finally:
-        conn.close()
+    api_key = authenticate(username, password)
+    if api_key:
+        save_session(username, api_key)
+    return api_key
 
 # Part 2: Session Management and Configuration
 
 @handle_error
 def save_session(username, api_key):
+    token, expires_at = get_sessions().create(username)
+    st.session_state.session_token = token
     cookie_manager = get_cookie_manager()
-    session_data = {
-        'username': username,
-        'api_key': api_key,
-        'timestamp': str(datetime.now())
-    }
-    cookie_manager.set('session_data', json.dumps(session_data), 
-                      expires_at=datetime.now() + timedelta(days=30))
+    cookie_manager.set(settings.SESSION_COOKIE, token,
+                      expires_at=datetime.fromtimestamp(expires_at))
+    if LEGACY_SESSION_COOKIE in cookie_manager.cookies:
+        # Older versions kept the raw API key in the browser
+        delete_cookie(cookie_manager, LEGACY_SESSION_COOKIE, key="delete_legacy")
 
 @handle_error
 def load_session():
+    """Restore the login from the session cookie; (None, None) if there is none"""
     try:
-        cookie_manager = get_cookie_manager()
-        session_data = cookie_manager.get('session_data')
-        if session_data:
-            data = json.loads(session_data)
-            return data.get('username'), data.get('api_key')
+        token = get_cookie_manager().get(settings.SESSION_COOKIE)
+        session = get_sessions().resolve(token)
+        if session:
+            st.session_state.session_token = token
+            return session
     except Exception as e:
         logger.error(f"Session loading error: {str(e)}")
     return None, None
@@ -127,16 +130,16 @@ def load_session():
 @handle_error
 def clear_session():
     try:
-        cookie_manager = get_cookie_manager()
-        cookie_manager.delete('session_data')
+        get_sessions().revoke(st.session_state.get('session_token'))
+        if st.session_state.get('session_id'):
+            # Drops a prefetched prompt nobody will pick up any more
+            get_prompt_prefetcher().discard(st.session_state.session_id)
+        delete_cookie(get_cookie_manager(), settings.SESSION_COOKIE)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
     except Exception as e:
         logger.error(f"Session clearing error: {str(e)}")
 
-# Initialize the database
-init_db()
-
 # Page Configuration
 st.set_page_config(
     page_title="AI სურათების გენერატორი",
@@ -145,6 +148,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Initialize the database
+init_db()
+
 # Initialize session state
 def init_session_state():
     if 'authenticated' not in st.session_state:
@@ -155,251 +161,30 @@ def init_session_state():
         st.session_state.page = 'auth'
     if 'user_data' not in st.session_state:
         st.session_state.user_data = {}
-    if 'history' not in st.session_state:
-        st.session_state.history = []
+    if 'gallery_cursors' not in st.session_state:
+        st.session_state.gallery_cursors = [None]
     if 'username' not in st.session_state:
         st.session_state.username = None
     if 'error' not in st.session_state:
         st.session_state.error = None
     if 'form_submitted' not in st.session_state:
         st.session_state.form_submitted = False
-
-# Global client variable
-client = None
-
-# Data structures
-hobbies = {
-    "სპორტი": {
-        "ფეხბურთი": "football",
-        "კალათბურთი": "basketball",
-        "ჭადრაკი": "chess",
-        "ცურვა": "swimming",
-        "იოგა": "yoga",
-        "ჩოგბურთი": "tennis",
-        "სირბილი": "running"
-    },
-    "ხელოვნება": {
-        "ხატვა": "painting",
-        "მუსიკა": "music",
-        "ცეკვა": "dancing",
-        "ფოტოგრაფია": "photography",
-        "კერამიკა": "ceramics",
-        "ქარგვა": "embroidery"
-    },
-    "ტექნოლოგია": {
-        "პროგრამირება": "programming",
-        "გეიმინგი": "gaming",
-        "რობოტიკა": "robotics",
-        "3D მოდელირება": "3D modeling",
-        "AI": "artificial intelligence"
-    },
-    "ბუნება": {
-        "მებაღეობა": "gardening",
-        "ლაშქრობა": "hiking",
-        "კემპინგი": "camping",
-        "ალპინიზმი": "mountain climbing"
-    }
-}
-
-colors = {
-    "წითელი": "red",
-    "ლურჯი": "blue",
-    "მწვანე": "green",
-    "ყვითელი": "yellow",
-    "იისფერი": "purple",
-    "ოქროსფერი": "gold",
-    "ვერცხლისფერი": "silver",
-    "ცისფერი": "light blue"
-}
-
-styles = {
-    "რეალისტური": "realistic",
-    "ფანტასტიკური": "fantastic",
-    "მულტიპლიკაციური": "cartoon",
-    "ანიმე": "anime",
-    "იმპრესიონისტული": "impressionistic"
-}
-
-moods = {
-    "მხიარული": "cheerful",
-    "მშვიდი": "peaceful",
-    "ენერგიული": "energetic",
-    "რომანტიული": "romantic",
-    "სათავგადასავლო": "adventurous",
-    "ნოსტალგიური": "nostalgic"
-}
-
-filters = {
-    "ბუნებრივი": "natural",
-    "რეტრო": "retro",
-    "დრამატული": "dramatic",
-    "ნათელი": "bright",
-    "კონტრასტული": "high contrast"
-}
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
 # Part 3: Authentication and Core UI Components
 
 # Custom styling
-st.markdown("""
-    <style>
-    /* Hide Streamlit elements */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Remove empty frames by hiding the block-container padding */
-    .block-container {
-        max-width: 1000px !important;
-        padding: 0 !important;
-        margin: 0 auto !important;
-    }
-
-    /* Hide all empty containers */
-    .stContainer:empty,
-    .block-container:empty,
-    .input-container:empty,
-    .generation-container:empty,
-    .feature-container:empty {
-        display: none;
-    }
-
-    /* Base theme */
-    .stApp {
-        background: linear-gradient(150deg, #1a1a2e 0%, #16213e 100%);
-        color: white;
-        margin-top: 1rem;
-    }
+@st.cache_resource
+def load_css():
+    """Read the stylesheet once per process"""
+    with open(os.path.join(APP_DIR, "styles.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
-    /* Container styling */
-    .input-container, .generation-container {
-        background: rgba(255, 255, 255, 0.05);
-        padding: 2rem;
-        border-radius: 20px;
-        backdrop-filter: blur(10px);
-        margin: 1rem auto;
-        max-width: 900px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-
-    /* Auth container */
-    .auth-container {
-        background: rgba(255, 255, 255, 0.05);
-        padding: 2rem;
-        border-radius: 20px;
-        backdrop-filter: blur(10px);
-        margin: 2rem auto;
-        max-width: 500px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-
-    /* Feature container */
-    .feature-container {
-        background: rgba(255, 255, 255, 0.08);
-        padding: 1rem;
-        border-radius: 10px;
-        margin-bottom: 1rem;
-    }
-
-    /* Input styling */
-    .stTextInput > div > div > input {
-        background: rgba(255, 255, 255, 0.07);
-        color: white;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 10px;
-        padding: 0.75rem 1rem;
-    }
-
-    /* Select box styling */
-    .stSelectbox > div > div {
-        background: rgba(255, 255, 255, 0.07);
-        border-radius: 10px;
-        color: white !important;
-    }
-
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(45deg, #FF9A9E, #FAD0C4);
-        color: #1a1a2e;
-        border: none;
-        padding: 0.75rem 2rem;
-        border-radius: 10px;
-        font-weight: bold;
-        width: 100%;
-        transition: all 0.3s ease;
-    }
-
-    /* Form submit button styling */
-    .stFormSubmitter > button {
-        background: linear-gradient(45deg, #FF9A9E, #FAD0C4);
-        color: #1a1a2e;
-        border: none;
-        padding: 0.75rem 2rem;
-        border-radius: 10px;
-        font-weight: bold;
-        width: 100%;
-        transition: all 0.3s ease;
-    }
-
-    /* User info styling */
-    .user-info {
-        position: fixed;
-        top: 1rem;
-        right: 1rem;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-        z-index: 999;
-        background: rgba(26, 26, 46, 0.8);
-        padding: 0.5rem 1rem !important;
-        border-radius: 20px;
-        backdrop-filter: blur(10px);
-    }
-
-    .user-info span {
-        color: rgba(255, 255, 255, 0.8);
-        font-size: 0.9rem;
-    }
-
-    /* QR container */
-    .qr-container {
-        background: white;
-        padding: 1.5rem;
-        border-radius: 15px;
-        text-align: center;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-        margin: 1rem auto;
-        max-width: 250px;
-    }
-
-    /* Instructions container */
-    .instructions-container {
-        background: rgba(255, 255, 255, 0.08);
-        padding: 1.5rem;
-        border-radius: 15px;
-        margin: 1rem auto;
-    }
-
-    /* Download button styling */
-    .download-button {
-        display: inline-block;
-        background: linear-gradient(45deg, #FF9A9E, #FAD0C4);
-        color: #1a1a2e;
-        text-decoration: none;
-        padding: 0.75rem 2rem;
-        border-radius: 10px;
-        font-weight: bold;
-        width: 100%;
-        text-align: center;
-        transition: all 0.3s ease;
-    }
-    
-    .download-button:hover {
-        opacity: 0.9;
-        color: #1a1a2e;
-        text-decoration: none;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Streamlit drops elements a rerun does not emit again, so the styles are re-sent every run
+st.markdown(load_css(), unsafe_allow_html=True)
 
 @handle_error
 def show_auth_page():
@@ -448,25 +233,6 @@ def show_auth_page():
 
     st.markdown('</div>', unsafe_allow_html=True)
 
-def create_qr_code(url):
-    """Create a QR code for the given URL"""
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        buffered = BytesIO()
-        qr_image.save(buffered, format="PNG")
-        return buffered.getvalue()
-    except Exception as e:
-        logger.error(f"QR code creation error: {str(e)}")
-        return None
-
 def show_user_header():
     """Display user header with logout button"""
     if st.session_state.get('authenticated', False):
@@ -483,64 +249,96 @@ def show_user_header():
 
 # Part 4: Core Functionality and Main Logic
 
-@handle_error
-def display_input_page():
-    """Display the input form page"""
-    st.markdown('<div class="input-container">', unsafe_allow_html=True)
+@st.cache_resource
+def form_options():
+    """Option lists of the input form, built once per process"""
+    return {
+        "hobby_category": list(hobbies),
+        "hobby": {category: list(options) for category, options in hobbies.items()},
+        "color": list(colors),
+        "style": list(styles),
+        "mood": list(moods),
+        "filter": list(filters),
+    }
 
-    # Create two rows with four columns each
-    row1_col1, row1_col2, row1_col3, row1_col4 = st.columns(4)
-    row2_col1, row2_col2, row2_col3, row2_col4 = st.columns(4)
+# Each row of the form is a fragment, so a widget change reruns its own row
+# instead of the whole script; the category -> hobby dependency lives in one row.
 
-    # First row inputs
-    with row1_col1:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+def form_user_data():
+    """The current form values, read from the widgets' session state"""
+    state = st.session_state
+    return {
+        "name": state.get("name_input", ""),
+        "age": state.get("age_input", 25),
+        "hobby_category": state.get("category_input"),
+        "hobby": state.get("hobby_input"),
+        "color": state.get("color_input"),
+        "style": state.get("style_input"),
+        "mood": state.get("mood_input"),
+        "filter": state.get("filter_input")
+    }
+
+def maybe_prefetch():
+    user_data = form_user_data()
+    if settings.PROMPT_PREFETCH and settings.PROMPT_MODE != "template" and user_data['name']:
+        prefetch_prompt(user_data)
+
+@st.fragment
+def profile_row():
+    options = form_options()
+    col1, col2, col3, col4 = st.columns(4)
+
+    # The empty feature-container wrappers are hidden by the stylesheet, so only the labels are emitted
+    with col1:
         st.markdown('<p class="feature-label">👤 სახელი</p>', unsafe_allow_html=True)
-        name = st.text_input("", placeholder="მაგ: გიორგი", label_visibility="collapsed", key="name_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.text_input("სახელი", placeholder="მაგ: გიორგი", label_visibility="collapsed", key="name_input")
 
-    with row1_col2:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col2:
         st.markdown('<p class="feature-label">🎂 ასაკი</p>', unsafe_allow_html=True)
-        age = st.number_input("", min_value=5, max_value=100, value=25, label_visibility="collapsed", key="age_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.number_input("ასაკი", min_value=5, max_value=100, value=25, label_visibility="collapsed", key="age_input")
 
-    with row1_col3:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col3:
         st.markdown('<p class="feature-label">🎯 კატეგორია</p>', unsafe_allow_html=True)
-        hobby_category = st.selectbox("", list(hobbies.keys()), label_visibility="collapsed", key="category_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        hobby_category = st.selectbox("კატეგორია", options['hobby_category'], label_visibility="collapsed", key="category_input")
 
-    with row1_col4:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col4:
         st.markdown('<p class="feature-label">🎨 ჰობი</p>', unsafe_allow_html=True)
-        hobby = st.selectbox("", list(hobbies[hobby_category].keys()), label_visibility="collapsed", key="hobby_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.selectbox("ჰობი", options['hobby'][hobby_category], label_visibility="collapsed", key="hobby_input")
+
+    maybe_prefetch()
 
-    # Second row inputs
-    with row2_col1:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+@st.fragment
+def style_row():
+    options = form_options()
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
         st.markdown('<p class="feature-label">🎨 ფერი</p>', unsafe_allow_html=True)
-        color = st.selectbox("", list(colors.keys()), label_visibility="collapsed", key="color_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.selectbox("ფერი", options['color'], label_visibility="collapsed", key="color_input")
 
-    with row2_col2:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col2:
         st.markdown('<p class="feature-label">🖼️ სტილი</p>', unsafe_allow_html=True)
-        style = st.selectbox("", list(styles.keys()), label_visibility="collapsed", key="style_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.selectbox("სტილი", options['style'], label_visibility="collapsed", key="style_input")
 
-    with row2_col3:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col3:
         st.markdown('<p class="feature-label">😊 განწყობა</p>', unsafe_allow_html=True)
-        mood = st.selectbox("", list(moods.keys()), label_visibility="collapsed", key="mood_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.selectbox("განწყობა", options['mood'], label_visibility="collapsed", key="mood_input")
 
-    with row2_col4:
-        st.markdown('<div class="feature-container">', unsafe_allow_html=True)
+    with col4:
         st.markdown('<p class="feature-label">🌈 ფილტრი</p>', unsafe_allow_html=True)
-        filter_effect = st.selectbox("", list(filters.keys()), label_visibility="collapsed", key="filter_input")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.selectbox("ფილტრი", options['filter'], label_visibility="collapsed", key="filter_input")
+
+    maybe_prefetch()
+
+@handle_error
+def display_input_page():
+    """Display the input form page"""
+    st.markdown('<div class="input-container">', unsafe_allow_html=True)
+
+    profile_row()
+    style_row()
+    user_data = form_user_data()
+    name = user_data['name']
 
     # Generate button section
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -550,149 +348,393 @@ def display_input_page():
                 show_error_message("გთხოვთ შეიყვანოთ სახელი", show_retry=False)
                 return
 
-            st.session_state.user_data = {
-                "name": name,
-                "age": age,
-                "hobby_category": hobby_category,
-                "hobby": hobby,
-                "color": color,
-                "style": style,
-                "mood": mood,
-                "filter": filter_effect
-            }
+            prefetched = None
+            if settings.PROMPT_PREFETCH:
+                prefetched = get_prompt_prefetcher().take(
+                    st.session_state.session_id,
+                    request_key(user_data, st.session_state.username)
+                )
+
+            st.session_state.user_data = user_data
+            st.session_state.job_id = submit_generation(
+                st.session_state.username, user_data, prefetched=prefetched
+            )
             st.session_state.page = 'generate'
             st.rerun()
 
-    st.markdown('</div>', unsafe_allow_html=True)
+        if st.button("🖼️ ჩემი გალერეა", use_container_width=True, key="gallery_button"):
+            st.session_state.gallery_cursors = [None]
+            st.session_state.page = 'gallery'
+            st.rerun()
 
-def translate_user_data(user_data):
-    """Translate Georgian user data to English"""
-    return {
-        "name": user_data['name'],
-        "age": user_data['age'],
-        "hobby": hobbies[user_data['hobby_category']][user_data['hobby']],
-        "color": colors[user_data['color']],
-        "style": styles[user_data['style']],
-        "mood": moods[user_data['mood']],
-        "filter": filters[user_data['filter']]
-    }
+        if st.session_state.username in settings.ADMIN_USERS:
+            if st.button("📊 მეტრიკები", use_container_width=True, key="admin_button"):
+                st.session_state.page = 'admin'
+                st.rerun()
 
-def create_personalized_prompt(user_data):
-    """Create a personalized English prompt based on translated user information"""
-    try:
-        eng_data = translate_user_data(user_data)
-
-        prompt_request = f"""
-        Create a detailed image prompt for a {eng_data['age']}-year-old named {eng_data['name']} 
-        who loves {eng_data['hobby']}. 
-
-        Key elements to incorporate:
-        - Favorite color: {eng_data['color']}
-        - Visual style: {eng_data['style']}
-        - Mood: {eng_data['mood']}
-        - Filter effect: {eng_data['filter']}
-
-        Create a personalized, artistic scene that captures their interests and personality.
-        Focus on cinematic composition, dramatic lighting, and high-quality details.
-        Make it engaging and suitable for an expo demonstration.
-        Ensure the image is family-friendly and appropriate for all ages.
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert at crafting detailed image generation prompts. Focus on creating vivid, specific descriptions that work well with DALL-E 3."},
-                {"role": "user", "content": prompt_request}
-            ],
-            temperature=0.7
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def submit_generation(username, user_data, prefetched=None):
+    """Submit a generation job, reattaching to an identical one that is still running
+
+    A prefetched (english_prompt, georgian_summary) pair lets the job skip
+    its prompt stage.
+    """
+    flight = get_singleflight()
+    dedupe_key = request_key(user_data, username) if flight else None
+    # A pre-generated image for these choices beats even a prefetched prompt
+    result = take_pooled(user_data)
+    if result is None and prefetched:
+        result = {
+            "user_data": user_data,
+            "english_prompt": prefetched[0],
+            "georgian_summary": prefetched[1],
+            "timings": {"prompt": 0.0},
+            "completed": ["prompt"]
+        }
+    job_id, reused = get_job_queue().submit(
+        username, user_data, dedupe_key=dedupe_key, result=result,
+        session_id=st.session_state.session_id
+    )
+    if reused:
+        flight.count_saved()
+        if result and result.get('pooled'):
+            get_image_pool().release(result['pool_entry_id'])
+    return job_id
+
+@st.cache_resource
+def get_prompt_prefetcher():
+    return PromptPrefetcher(debounce=settings.PROMPT_PREFETCH_DEBOUNCE)
+
+def prefetch_prompt(user_data):
+    """Start expanding the prompt for the current form values once they settle"""
+    username = st.session_state.username
+    api_key = st.session_state.api_key
+    session_id = st.session_state.session_id
+
+    def expand():
+        current_session.set(session_id)
+        # Routed through the prompt stage's coalescing key, so a job that
+        # starts before the prefetch finishes waits for it instead of repeating it
+        return coalesced(
+            "prompt", user_data, username,
+            lambda: create_personalized_prompt(user_data, get_client(api_key))
         )
 
-        english_prompt = response.choices[0].message.content
+    get_prompt_prefetcher().schedule(session_id, request_key(user_data, username), expand)
 
-        georgian_summary = f"""🎨 რას ვქმნით: 
-        პერსონალიზებული სურათი {user_data['name']}-სთვის
-        • ჰობი: {user_data['hobby']}
-        • სტილი: {user_data['style']}
-        • განწყობა: {user_data['mood']}
-        • ფილტრი: {user_data['filter']}
-        """
+@st.cache_resource
+def get_job_queue():
+    """Create the process-wide job queue once and resume unfinished jobs"""
+    queue = JobQueue(
+        run_generation_job, get_db(), max_workers=settings.JOB_WORKERS,
+        on_done=schedule_upgrade, state=get_state()
+    )
+    if queue.state.shared:
+        queue.start_heartbeat(settings.REPLICA_HEARTBEAT_SECONDS)
+    queue.resume_pending()
+    return queue
+
+def collect_app_gauges():
+    """Gauges read at scrape time from the in-process subsystems"""
+    gauges = [("weart_openai_clients", {}, len(get_client_registry()))]
+    for name, value in qr_cache_stats().items():
+        gauges.append(("weart_qr_cache", {"kind": name}, value))
+    flight = get_singleflight()
+    if flight is not None:
+        for name, value in flight.stats().items():
+            gauges.append(("weart_singleflight", {"kind": name}, value))
+    cache = get_prompt_cache()
+    if cache is not None:
+        for name, value in cache.stats().items():
+            gauges.append(("weart_prompt_cache", {"kind": name}, value))
+    pool = get_image_pool()
+    if pool is not None:
+        for name, value in pool.stats().items():
+            gauges.append(("weart_image_pool", {"kind": name}, value))
+    for stats in breaker_stats():
+        gauges.append(("weart_circuit_open", {"circuit": stats['circuit']}, int(stats['state'] != 'closed')))
+        gauges.append(("weart_circuit_failure_rate", {"circuit": stats['circuit']}, stats['failure_rate']))
+    return gauges
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Register the app gauges and serve /metrics once per process"""
+    REGISTRY.add_collector(collect_app_gauges)
+    if not settings.METRICS_PORT:
+        return None
+    return start_metrics_server(settings.METRICS_PORT, settings.METRICS_HOST)
 
-        return english_prompt, georgian_summary
+@st.cache_resource
+def start_image_pool_warmer():
+    """Pre-generate popular combinations while idle, once per process"""
+    return start_pool_warmer()
 
-    except Exception as e:
-        logger.error(f"Error creating prompt: {str(e)}")
-        return None, None
+@st.cache_resource
+def start_link_endpoint():
+    """Serve the /i/<id> short links once per process, if QR codes use them"""
+    if not settings.LINK_PORT or not settings.LINK_BASE_URL:
+        return None
+    return start_link_server(settings.LINK_PORT, settings.LINK_HOST)
+
+def format_stage_timings(timings):
+    """Format stage timings as a short caption"""
+    labels = dict(GENERATION_STAGES)
+    parts = [f"{labels[stage]}: {elapsed:.1f} წმ" for stage, elapsed in timings.items()]
+    return " · ".join(parts + [f"სულ: {sum(timings.values()):.1f} წმ"])
+
+def show_generation_result(result, upgrading=False):
+    """Display the image, QR code and download link of a finished generation"""
+    image_id = result.get('image_id')
+    if image_id and get_image_store().exists(image_id):
+        display_image = get_image_store().path(image_id, "display")
+        download_url = static_url(image_id, "download")
+    else:
+        display_image = download_url = result['image_url']
+
+    st.success("✨ თქვენი სურათი მზადაა!")
+    st.image(display_image, caption="შენი პერსონალური AI სურათი", use_container_width=True)
+    st.caption(f"⏱️ {format_stage_timings(result['timings'])}")
+    if upgrading:
+        st.info("⏳ მზადდება HD ვერსია — სურათი მზადყოფნისთანავე განახლდება")
+    elif (result.get('upgrade') or {}).get('status') == 'done':
+        st.caption(f"✨ HD ვერსია მზადაა — {result['upgrade']['seconds']:.1f} წმ")
+    elif result.get('pooled'):
+        st.caption("⚡ წინასწარ მომზადებული სურათი, შენი სახელით")
+    if result.get('fallback_tier'):
+        st.caption("⚠️ სერვისი გადატვირთულია — სურათი შეიქმნა სწრაფ რეჟიმში")
+
+    qr_col1, qr_col2 = st.columns([1, 2])
+    with qr_col1:
+        st.markdown('<div class="qr-container">', unsafe_allow_html=True)
+        qr_code = create_qr_code(result['qr_url']) if result.get('qr_url') else None
+        if isinstance(qr_code, str):
+            st.markdown(f'<div style="width:200px">{qr_code}</div>', unsafe_allow_html=True)
+        elif qr_code:
+            st.image(qr_code, width=200)
+        elif result.get('qr_code'):
+            # Results stored before QR codes were rendered on demand
+            st.image(base64.b64decode(result['qr_code']), width=200)
+        if qr_code or result.get('qr_code'):
+            st.markdown("📱 დაასკანერე QR კოდი")
+        st.markdown('</div>', unsafe_allow_html=True)
 
-def generate_dalle_image(prompt):
-    """Generate image using DALL-E 3"""
-    try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1792x1024",
-            quality="hd",
-            style="vivid",
-            n=1
+    with qr_col2:
+        st.markdown('<div class="instructions-container">', unsafe_allow_html=True)
+        st.markdown("""
+            ### 📱 როგორ გადმოვწერო:
+            1. გახსენი ტელეფონის კამერა
+            2. დაასკანერე QR კოდი
+            3. გადმოწერე სურათი
+        """)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(
+            f'<a href="{download_url}" class="download-button" '
+            f'download="ai_image.jpg" target="_blank">📥 გადმოწერა</a>',
+            unsafe_allow_html=True
         )
-        return response.data[0].url
-    except Exception as e:
-        logger.error(f"Error generating image: {str(e)}")
-        return None
+    with col2:
+        if st.button("🔄 ახალი სურათი", type="primary", key="new_image"):
+            st.session_state.job_id = None
+            st.session_state.page = 'input'
+            st.rerun()
+
+def show_job_progress(job, progress_bar, stage_lines):
+    """Render the stage list and progress bar for a queued or running job"""
+    result = job['result']
+    completed = result.get('completed', [])
+    timings = result.get('timings', {})
+    running = next((stage for stage, _ in GENERATION_STAGES if stage not in completed), None)
+
+    for stage, label in GENERATION_STAGES:
+        if stage in completed:
+            stage_lines[stage].markdown(f"✅ {label} — {timings[stage]:.1f} წმ")
+        elif job['status'] == 'running' and stage == running:
+            stage_lines[stage].markdown(f"⏳ {label}...")
+        else:
+            stage_lines[stage].markdown(f"▫️ {label}")
+
+    label = dict(GENERATION_STAGES).get(running, "")
+    if job['status'] == 'queued':
+        label = "⏳ რიგში..."
+    progress_bar.progress(int(len(completed) * 100 / len(GENERATION_STAGES)), text=label)
+
+def show_generation_details(job, expanded):
+    """Display the Georgian summary and return the slot for the English prompt
+
+    The summary needs no API call, so it is shown as soon as the job exists.
+    """
+    st.markdown("#### 🔮 სურათის დეტალები:")
+    st.markdown(job['result'].get('georgian_summary') or create_georgian_summary(job['user_data']))
+    with st.expander("🔍 სრული აღწერა", expanded=expanded):
+        return st.empty()
+
+def show_live_prompt(job, live, prompt_line):
+    """Render the English prompt of a running job, including a partly streamed one"""
+    english_prompt = job['result'].get('english_prompt')
+    if english_prompt:
+        prompt_line.markdown(f"*{english_prompt}*")
+    elif live.get('english_prompt'):
+        prompt_line.markdown(f"*{live['english_prompt']}* ▌")
+    else:
+        prompt_line.caption("✍️ აღწერა იწერება...")
 
 @handle_error
 def display_generation_page():
-    """Display the image generation and result page"""
+    """Display the progress and result of the current generation job"""
     st.markdown('<div class="generation-container">', unsafe_allow_html=True)
 
-    with st.spinner("🎨 ვქმნით შენთვის უნიკალურ სურათს..."):
+    queue = get_job_queue()
+    job = queue.get(st.session_state.job_id) if st.session_state.job_id else None
+    if job is None:
+        st.session_state.page = 'input'
+        st.rerun()
+
+    prompt_line = show_generation_details(job, expanded=job['status'] in ACTIVE_STATUSES)
+    show_live_prompt(job, {}, prompt_line)
+
+    if job['status'] in ACTIVE_STATUSES:
         progress_bar = st.progress(0)
-        for i in range(100):
-            time.sleep(0.01)
-            progress_bar.progress(i + 1)
-
-        english_prompt, georgian_summary = create_personalized_prompt(st.session_state.user_data)
-        if english_prompt and georgian_summary:
-            st.markdown("#### 🔮 სურათის დეტალები:")
-            st.markdown(georgian_summary)
-
-            with st.expander("🔍 სრული აღწერა"):
-                st.markdown(f"*{english_prompt}*")
-
-            image_url = generate_dalle_image(english_prompt)
-            if image_url:
-                st.success("✨ თქვენი სურათი მზადაა!")
-                st.image(image_url, caption="შენი პერსონალური AI სურათი", use_column_width=True)
-
-                qr_col1, qr_col2 = st.columns([1, 2])
-                with qr_col1:
-                    st.markdown('<div class="qr-container">', unsafe_allow_html=True)
-                    qr_code = create_qr_code(image_url)
-                    if qr_code:
-                        st.image(qr_code, width=200)
-                        st.markdown("📱 დაასკანერე QR კოდი")
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                with qr_col2:
-                    st.markdown('<div class="instructions-container">', unsafe_allow_html=True)
-                    st.markdown("""
-                        ### 📱 როგორ გადმოვწერო:
-                        1. გახსენი ტელეფონის კამერა
-                        2. დაასკანერე QR კოდი
-                        3. გადმოწერე სურათი
-                    """)
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown(
-                        f'<a href="{image_url}" class="download-button" '
-                        f'download="ai_image.png" target="_blank">📥 გადმოწერა</a>',
-                        unsafe_allow_html=True
-                    )
-                with col2:
-                    if st.button("🔄 ახალი სურათი", type="primary", key="new_image"):
-                        st.session_state.page = 'input'
-                        st.rerun()
+        status = st.status("🎨 ვქმნით შენთვის უნიკალურ სურათს...", expanded=True)
+        stage_lines = {stage: status.empty() for stage, _ in GENERATION_STAGES}
+
+        # A rerun interrupts this loop but not the job; the next run reattaches
+        seen = queue.version(job['id'])
+        while job['status'] in ACTIVE_STATUSES:
+            show_job_progress(job, progress_bar, stage_lines)
+            show_live_prompt(job, queue.live(job['id']), prompt_line)
+            seen = queue.wait(job['id'], seen)
+            job = queue.get(job['id'])
+
+        show_live_prompt(job, {}, prompt_line)
+        progress_bar.empty()
+        if job['status'] == 'done':
+            status.update(label="✨ სურათი მზადაა", state="complete", expanded=False)
+        else:
+            status.update(label="სურათის შექმნა ვერ მოხერხდა", state="error")
+
+    upgrading = job['status'] == 'done' and upgrade_in_flight(job['id'])
+    if job['status'] == 'done':
+        show_generation_result(job['result'], upgrading=upgrading)
+    else:
+        failed_stage = job['result'].get('failed_stage')
+        reason = dict(GENERATION_STAGES).get(failed_stage, job['error'])
+        show_error_message(f"ეტაპი ვერ შესრულდა: {reason}", show_retry=False)
+        if job['result'].get('unavailable'):
+            st.info("⏳ სურათების სერვისი დროებით მიუწვდომელია — სცადეთ რამდენიმე წუთში")
+        if st.button("🔄 ხელახლა ცდა", key="retry_job", type="primary"):
+            st.session_state.job_id = submit_generation(st.session_state.username, job['user_data'])
+            st.rerun()
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if upgrading:
+        # Show the preview until the upgrade is swapped in. Streamlit only delivers a
+        # click's rerun into a script that touches st, so the session state is read
+        # on every poll; that way any click interrupts the wait.
+        seen = queue.version(job['id'])
+        while st.session_state.job_id == job['id'] and upgrade_in_flight(job['id']):
+            seen = queue.wait(job['id'], seen)
+        st.rerun()
+
+@handle_error
+def display_gallery_page():
+    """Display the user's previous generations one page at a time"""
+    st.markdown('<div class="generation-container">', unsafe_allow_html=True)
+    st.markdown("#### 🖼️ ჩემი გალერეა")
+
+    # Only the cursors of visited pages live in the session, never the images
+    cursors = st.session_state.gallery_cursors
+    items, next_cursor = get_history().page(
+        st.session_state.username, settings.GALLERY_PAGE_SIZE, before=cursors[-1]
+    )
+
+    if not items and len(cursors) == 1:
+        st.info("ჯერ სურათები არ გაქვს შექმნილი")
+
+    store = get_image_store()
+    columns = st.columns(3)
+    for index, item in enumerate(items):
+        with columns[index % 3]:
+            image_id = item['image_id']
+            if image_id and store.exists(image_id, "thumb"):
+                st.image(store.path(image_id, "thumb"), use_container_width=True)
+                st.markdown(f"[📥 გადმოწერა]({static_url(image_id, 'download')})")
+            elif item['image_url']:
+                st.image(item['image_url'], use_container_width=True)
+            user_data = item['user_data']
+            st.caption(f"{user_data['name']} · {user_data['hobby']} · {user_data['style']} · {item['created_at']}")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if len(cursors) > 1 and st.button("⬅️ წინა", key="gallery_prev"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("✨ ახალი სურათი", type="primary", key="gallery_back"):
+            st.session_state.page = 'input'
+            st.rerun()
+    with col3:
+        if next_cursor and st.button("შემდეგი ➡️", key="gallery_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@handle_error
+def display_admin_page():
+    """Display latency percentiles and counters for admins"""
+    if st.session_state.username not in settings.ADMIN_USERS:
+        st.session_state.page = 'input'
+        st.rerun()
+
+    st.markdown('<div class="generation-container">', unsafe_allow_html=True)
+    st.markdown("#### 📊 მეტრიკები")
+
+    st.markdown("##### ⏱️ დაყოვნება (წამებში)")
+    summary = REGISTRY.summary()
+    if summary:
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+    else:
+        st.info("ჯერ მონაცემები არ არის")
+
+    st.markdown("##### 🔢 მთვლელები")
+    st.dataframe(REGISTRY.counters(), use_container_width=True, hide_index=True)
+
+    circuits = breaker_stats()
+    if circuits:
+        st.markdown("##### 🔌 OpenAI სერვისები")
+        st.dataframe(circuits, use_container_width=True, hide_index=True)
+
+    # Lets staff trade image quality for queue throughput at peak times
+    st.markdown("##### 🖼️ სურათის ხარისხი")
+    tier, upgrade_tier = image_plan()
+    tiers = list(IMAGE_TIERS)
+    upgrade_options = ["არა", *tiers]
+    col1, col2 = st.columns(2)
+    with col1:
+        new_tier = st.selectbox("ხარისხი", tiers, index=tiers.index(tier), key="admin_tier")
+    with col2:
+        new_upgrade = st.selectbox(
+            "ფონური HD განახლება", upgrade_options,
+            index=upgrade_options.index(upgrade_tier or "არა"), key="admin_upgrade_tier"
+        )
+    new_upgrade = None if new_upgrade == "არა" else new_upgrade
+    if (new_tier, new_upgrade) != (tier, upgrade_tier):
+        set_image_plan(new_tier, new_upgrade)
+        logger.info(f"Image plan changed to {image_plan()} by {st.session_state.username}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 განახლება", key="admin_refresh"):
+            st.rerun()
+    with col2:
+        if st.button("✨ უკან", type="primary", key="admin_back"):
+            st.session_state.page = 'input'
+            st.rerun()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -701,6 +743,18 @@ def main():
     """Main application function"""
     # Initialize session state
     init_session_state()
+    start_metrics_endpoint()
+    start_link_endpoint()
+    start_image_pool_warmer()
+
+    # Auto-login: one cookie read and, usually, a session cache hit
+    if not st.session_state.authenticated:
+        username, api_key = load_session()
+        if username:
+            st.session_state.authenticated = True
+            st.session_state.api_key = api_key
+            st.session_state.username = username
+            st.session_state.page = 'input'
     
     # Title and subtitle
     st.markdown(
@@ -718,18 +772,27 @@ def main():
         if not st.session_state.get('authenticated', False):
             show_auth_page()
         else:
-            global client
-            client = OpenAI(api_key=st.session_state.api_key)
-            
+            # Reattach to a generation that is still running for this user
+            if not st.session_state.job_id:
+                active_job = get_job_queue().latest_active(st.session_state.username)
+                if active_job:
+                    st.session_state.job_id = active_job['id']
+                    st.session_state.page = 'generate'
+
             if st.session_state.get('page', 'input') == 'input':
                 display_input_page()
+            elif st.session_state.page == 'gallery':
+                display_gallery_page()
+            elif st.session_state.page == 'admin':
+                display_admin_page()
             else:
                 display_generation_page()
                 
     except Exception as e:
         show_error_message(e)
-        if "API" in str(e):
-            st.session_state.authenticated = False
+        # Only a rejected key ends the login; an outage leaves the user signed in
+        if is_auth_error(e):
+            clear_session()
             st.rerun()
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+"""Headless batch generation from a CSV or JSONL file of user profiles
+
+Each row holds name, age, hobby_category, hobby, color, style, mood and
+filter, using the Georgian option names from the app or their English
+translations; hobby_category may be left empty. Rows are validated up front
+and then generated concurrently through the same pipeline as the kiosk, so
+prompt caching, rate limiting and the local image store all apply:
+
+    python batch.py profiles.csv --user demo --workers 4
+
+Finished rows are appended to <out>/checkpoint.jsonl, so rerunning the same
+command skips them and only retries rows that failed or never ran. A
+manifest.json with per-row results and stage timings is written at the end.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from weart import catalog
+from weart.clients import get_client
+from weart.generation import IMAGE_TIERS, image_plan, run_generation_pipeline, set_image_plan
+from weart.history import get_history
+from weart.image_store import get_image_store
+from weart.ratelimit import current_session
+from weart.users import get_user_api_key
+
+FIELDS = ("name", "age", "hobby_category", "hobby", "color", "style", "mood", "filter")
+
+logger = logging.getLogger("batch")
+
+
+def _parse_line(line):
+    """Parse one JSONL line into (row, error)"""
+    try:
+        return json.loads(line.strip()), None
+    except json.JSONDecodeError as e:
+        return None, f"not valid JSON: {e.msg} at column {e.colno}"
+
+
+def read_rows(path):
+    """Read profiles from a .csv or .jsonl file as (line number, row, error) triples
+
+    error is None unless the line could not be parsed at all.
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            return [
+                (line_no, *_parse_line(line))
+                for line_no, line in enumerate(f, start=1)
+                if line.strip()
+            ]
+        return [(line_no, row, None) for line_no, row in enumerate(csv.DictReader(f), start=2)]
+
+
+def _option(value, options):
+    """Map a Georgian option name or its English translation to the option name"""
+    value = str(value).strip()
+    if value in options:
+        return value
+    for name, english in options.items():
+        if isinstance(english, str) and english.lower() == value.lower():
+            return name
+    raise ValueError(f"unknown value '{value}'")
+
+
+def validate_row(row, options):
+    """Return user_data in the app's form, or raise ValueError
+
+    hobby_category may be left empty; it is then looked up from the hobby.
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object with {', '.join(FIELDS)}, got {type(row).__name__}")
+    missing = [field for field in FIELDS if field != "hobby_category" and not str(row.get(field) or "").strip()]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    try:
+        age = int(row['age'])
+    except (TypeError, ValueError):
+        raise ValueError(f"age '{row['age']}' is not a number")
+    if not 5 <= age <= 100:
+        raise ValueError(f"age {age} is outside 5-100")
+
+    user_data = {"name": str(row['name']).strip(), "age": age}
+    for field in ("color", "style", "mood", "filter"):
+        try:
+            user_data[field] = _option(row[field], options[field])
+        except ValueError as e:
+            raise ValueError(f"{field}: {e}")
+
+    hobbies = options['hobby_category']
+    if str(row.get('hobby_category') or "").strip():
+        try:
+            categories = [_option(row['hobby_category'], hobbies)]
+        except ValueError as e:
+            raise ValueError(f"hobby_category: {e}")
+    else:
+        categories = list(hobbies)
+    for category in categories:
+        try:
+            user_data['hobby'] = _option(row['hobby'], hobbies[category])
+            user_data['hobby_category'] = category
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"hobby: unknown value '{row['hobby']}'")
+    return user_data
+
+
+def row_keys(user_rows):
+    """Stable checkpoint keys; repeated identical rows get their own key"""
+    seen = {}
+    keys = []
+    for user_data in user_rows:
+        digest = hashlib.sha256(
+            json.dumps(user_data, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()[:16]
+        seen[digest] = seen.get(digest, 0) + 1
+        keys.append(digest if seen[digest] == 1 else f"{digest}-{seen[digest]}")
+    return keys
+
+
+class Checkpoint:
+    """Append-only JSONL log of finished rows, safe to share between workers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+
+    def done(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry['status'] == 'done'
+
+    def record(self, entry):
+        with self._lock:
+            self.entries[entry['key']] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def summarize_timings(entries):
+    """Per-stage count, mean, p50 and p95 over the finished rows"""
+    samples = {}
+    for entry in entries:
+        for stage, elapsed in (entry.get('timings') or {}).items():
+            samples.setdefault(stage, []).append(elapsed)
+    summary = {}
+    for stage, values in samples.items():
+        ordered = sorted(values)
+        summary[stage] = {
+            "count": len(ordered),
+            "mean_s": round(sum(ordered) / len(ordered), 3),
+            "p50_s": round(ordered[len(ordered) // 2], 3),
+            "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate images for a CSV/JSONL file of user profiles")
+    parser.add_argument("input", help="profiles as .csv (with a header row) or .jsonl")
+    parser.add_argument("--user", help="registered user whose API key is used and whose gallery gets the images")
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY"), help="API key when --user is not given")
+    parser.add_argument("--workers", type=int, default=4, help="rows generated concurrently")
+    parser.add_argument("--tier", choices=list(IMAGE_TIERS), help="image tier (default: WEART_IMAGE_TIER)")
+    parser.add_argument("--out", help="output directory (default: batch-<input name>)")
+    parser.add_argument("--skip-invalid", action="store_true", help="generate the valid rows even if some rows are invalid")
+    parser.add_argument("--dry-run", action="store_true", help="only validate the input")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    options = {
+        "hobby_category": catalog.hobbies,
+        "color": catalog.colors,
+        "style": catalog.styles,
+        "mood": catalog.moods,
+        "filter": catalog.filters,
+    }
+    valid, invalid = [], []
+    for line_no, row, error in read_rows(args.input):
+        if error:
+            invalid.append((line_no, error))
+            continue
+        try:
+            user_data = validate_row(row, options)
+            catalog.translate_user_data(user_data)
+            valid.append((line_no, user_data))
+        except (ValueError, KeyError) as e:
+            invalid.append((line_no, str(e)))
+    for line_no, error in invalid:
+        logger.error(f"Line {line_no}: {error}")
+    logger.info(f"{len(valid)} valid rows, {len(invalid)} invalid")
+    if args.dry_run or (invalid and not args.skip_invalid):
+        sys.exit(1 if invalid else 0)
+
+    if args.user:
+        api_key = get_user_api_key(args.user)
+        if not api_key:
+            parser.error(f"no API key stored for user '{args.user}'")
+    elif args.api_key:
+        api_key = args.api_key
+    else:
+        parser.error("either --user or --api-key (or OPENAI_API_KEY) is required")
+    client = get_client(api_key)
+    username = args.user or "batch"
+    # Batch output is final, so there is no background upgrade
+    set_image_plan(args.tier or image_plan()[0], process_only=True)
+
+    out_dir = args.out or "batch-" + os.path.splitext(os.path.basename(args.input))[0]
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(out_dir, "checkpoint.jsonl"))
+    keys = row_keys([user_data for _, user_data in valid])
+    pending = [(key, line_no, user_data) for key, (line_no, user_data) in zip(keys, valid) if not checkpoint.done(key)]
+    logger.info(f"{len(valid) - len(pending)} rows already done, generating {len(pending)}")
+
+    def generate(key, line_no, user_data):
+        # One fairness session for the whole batch, so kiosk users keep their share of the API key
+        current_session.set(f"batch:{username}")
+        started = time.perf_counter()
+        persist = None
+        if args.user:
+            persist = lambda result: get_history().record(args.user, f"batch-{key}", result)
+        try:
+            result = run_generation_pipeline(user_data, client, persist=persist, username=username)
+            error = result['failed_stage'] and f"failed at {result['failed_stage']}"
+        except Exception as e:
+            result, error = {"timings": {}}, str(e)
+        image_id = result.get('image_id')
+        checkpoint.record({
+            "key": key,
+            "line": line_no,
+            "status": "failed" if error else "done",
+            "error": error,
+            "user_data": user_data,
+            "english_prompt": result.get('english_prompt'),
+            "image_id": image_id,
+            "image_path": get_image_store().path(image_id, "download") if image_id else None,
+            "image_url": result.get('image_url'),
+            "tier": result.get('tier'),
+            "qr_url": result.get('qr_url'),
+            "timings": result['timings'],
+            "elapsed": round(time.perf_counter() - started, 3),
+        })
+        return error
+
+    started = time.perf_counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as executor:
+        futures = {executor.submit(generate, *item): item for item in pending}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                key, line_no, user_data = futures[future]
+                error = future.result()
+                failed += bool(error)
+                logger.info(f"[{done}/{len(pending)}] line {line_no} {user_data['name']}: {error or 'done'}")
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finished rows are checkpointed, rerun to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    wall = time.perf_counter() - started
+
+    entries = [checkpoint.entries[key] for key in keys if key in checkpoint.entries]
+    manifest = {
+        "input": os.path.abspath(args.input),
+        "rows": len(valid),
+        "invalid": [{"line": line_no, "error": error} for line_no, error in invalid],
+        "done": sum(entry['status'] == 'done' for entry in entries),
+        "failed": sum(entry['status'] == 'failed' for entry in entries),
+        "wall_seconds": round(wall, 3),
+        "stage_timings": summarize_timings(entry for entry in entries if entry['status'] == 'done'),
+        "items": entries,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(
+        f"{manifest['done']}/{len(valid)} done, {manifest['failed']} failed in {wall:.1f}s; "
+        f"manifest written to {os.path.join(out_dir, 'manifest.json')}"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
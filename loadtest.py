@@ -0,0 +1,233 @@
+"""Headless load test of the kiosk generation flow
+
+Drives N concurrent sessions through login -> input page -> generation page
+with Streamlit's AppTest, against the local mock OpenAI server, and reports
+throughput and p50/p95/p99 latency per stage:
+
+    python loadtest.py --sessions 50 --iterations 2 --image-latency lognormal:12,0.3
+
+Client-side stages (login, submit, generation) are measured around the
+AppTest runs; server-side stages come from the stage timings recorded on
+each finished job. Runs against a throwaway database unless --db is given;
+images always go to a temporary store that is deleted afterwards.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock_openai
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, p):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = max(1, round(p / 100 * len(ordered) + 0.5))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _share_test_runtime():
+    """Keep one mock Runtime for all sessions
+
+    AppTest installs a mock Runtime before each script run and clears it
+    afterwards, which breaks any other session whose script is still running
+    in the same process.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+def _run(node):
+    # Streamlit 1.28's AppTest can fail to read the query string after a
+    # script calls st.rerun(); the element tree is already updated by then
+    try:
+        return node.run()
+    except KeyError as e:
+        if e.args != ("client_state",):
+            raise
+
+
+def _widget(at, kind, key, attempts=5):
+    """Find a widget by key, rerunning while the expected page is still settling"""
+    for attempt in range(attempts):
+        try:
+            return getattr(at, kind)(key=key)
+        except KeyError:
+            if attempt + 1 == attempts:
+                raise
+            _run(at)
+
+
+class SessionDriver:
+    def __init__(self, index, iterations, timeout):
+        self.index = index
+        self.username = f"loadtest{index}"
+        self.password = "loadtest-password"
+        self.iterations = iterations
+        self.timeout = timeout
+        self.samples = {}
+        self.errors = []
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def _button(self, at, label):
+        return next(button for button in at.button if button.label == label)
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=self.timeout)
+        _run(at)
+
+        _widget(at, "text_input", "register_username").input(self.username)
+        _widget(at, "text_input", "register_password").input(self.password)
+        _widget(at, "text_input", "confirm_password").input(self.password)
+        _widget(at, "text_input", "api_key_input").input("sk-loadtest")
+        _run(self._button(at, "რეგისტრაცია").click())
+
+        started = time.perf_counter()
+        for attempt in range(3):
+            _widget(at, "text_input", "login_username").input(self.username)
+            _widget(at, "text_input", "login_password").input(self.password)
+            _run(self._button(at, "შესვლა").click())
+            _run(at)
+            if at.session_state["authenticated"]:
+                break
+        else:
+            self.errors.append("login failed")
+            return
+        self.record("login", time.perf_counter() - started)
+
+        for iteration in range(self.iterations):
+            # Distinct names keep identical requests from being coalesced
+            _widget(at, "text_input", "name_input").input(f"სტუმარი {self.index}-{iteration}")
+            started = time.perf_counter()
+            for attempt in range(3):
+                _run(_widget(at, "button", "generate_button").click())
+                if at.session_state["job_id"]:
+                    break
+            self.record("submit", time.perf_counter() - started)
+
+            # The generation page blocks until the job is finished
+            while at.session_state["page"] == "generate" and not at.exception:
+                if any("მზადაა" in str(message.value) for message in at.success) or at.error:
+                    break
+                _run(at)
+            self.record("generation", time.perf_counter() - started)
+
+            job = self._finished_job(at.session_state["job_id"])
+            if job is None or job['status'] != 'done':
+                self.errors.append(f"job {at.session_state['job_id']} did not finish")
+            else:
+                for stage, seconds in job['result'].get('timings', {}).items():
+                    self.record(f"server:{stage}", seconds)
+
+            if job is not None and job['status'] == 'done':
+                _run(_widget(at, "button", "new_image").click())
+            else:
+                at.session_state["page"] = "input"
+                at.session_state["job_id"] = None
+            _run(at)
+
+    @staticmethod
+    def _finished_job(job_id):
+        from weart.db import get_db
+        from weart.jobs import JobQueue
+        return JobQueue(None, get_db(), max_workers=1).get(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the generation flow against a mock OpenAI server")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent kiosk sessions")
+    parser.add_argument("--iterations", type=int, default=1, help="generations per session")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per script run")
+    parser.add_argument("--base-url", help="use an already running OpenAI-compatible server")
+    parser.add_argument("--db", help="database path (default: a temporary file)")
+    parser.add_argument("--chat-per-minute", type=float, help="override the per-key chat rate limit")
+    parser.add_argument("--images-per-minute", type=float, help="override the per-key image rate limit")
+    mock_openai.add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        os.environ["WEART_OPENAI_BASE_URL"] = args.base_url
+    else:
+        server = mock_openai.start_server(mock_openai.config_from_args(args))
+        os.environ["WEART_OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    work_dir = tempfile.mkdtemp(prefix="weart-loadtest-")
+    os.environ["WEART_DB_PATH"] = args.db or os.path.join(work_dir, "users.db")
+    os.environ["WEART_IMAGE_STORE_DIR"] = os.path.join(work_dir, "images")
+    os.environ.setdefault("WEART_JOB_WORKERS", str(max(4, args.sessions)))
+    # All sessions share one API key, so the per-key governor applies to all of them
+    if args.chat_per_minute:
+        os.environ["WEART_RATE_LIMIT_CHAT_PER_MINUTE"] = str(args.chat_per_minute)
+    if args.images_per_minute:
+        os.environ["WEART_RATE_LIMIT_IMAGES_PER_MINUTE"] = str(args.images_per_minute)
+    sys.path.insert(0, APP_DIR)
+
+    _share_test_runtime()
+    try:
+        run_sessions(args, server)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_sessions(args, server):
+    drivers = [SessionDriver(index, args.iterations, args.timeout) for index in range(args.sessions)]
+
+    def drive(driver):
+        try:
+            driver.run()
+        except Exception as e:
+            driver.errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(driver,)) for driver in drivers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    samples = {}
+    for driver in drivers:
+        for stage, values in driver.samples.items():
+            samples.setdefault(stage, []).extend(values)
+    errors = [error for driver in drivers for error in driver.errors]
+    completed = len(samples.get("server:persist", []))
+
+    print(f"\n{args.sessions} sessions x {args.iterations} generations in {wall:.1f}s")
+    print(f"throughput: {completed / wall:.2f} generations/s ({completed} completed, {len(errors)} errors)")
+    print(f"{'stage':<20}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage in sorted(samples):
+        values = samples[stage]
+        print(
+            f"{stage:<20}{len(values):>7}{percentile(values, 50):>10.3f}"
+            f"{percentile(values, 95):>10.3f}{percentile(values, 99):>10.3f}"
+        )
+    if server is not None:
+        print(f"mock server calls: {server.stats.snapshot()}")
+    for error in errors[:10]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Local stand-in for the OpenAI chat completions and images endpoints
+
+Lets the generation flow run without spending real money:
+
+    python mock_openai.py --port 8600 --chat-latency lognormal:2,0.5 \
+        --image-latency lognormal:15,0.3 --rate-limit-rate 0.05
+    WEART_OPENAI_BASE_URL=http://127.0.0.1:8600/v1 streamlit run app.py
+
+Latency specs are "fixed:SECONDS", "uniform:LOW,HIGH", "lognormal:MEDIAN,SIGMA"
+or "tail:BASE,SLOW,PROBABILITY" for rare outliers. Generated image URLs point back at this server,
+which serves a solid-color PNG of the requested size. Streamed chat requests
+get their first token after the chat latency and one word per token interval.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a zero-argument sampler returning seconds"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    if kind == "tail":
+        # Mostly base seconds, but with the given probability a slow outlier
+        base, slow, probability = values
+        return lambda: slow if random.random() < probability else base
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class MockConfig:
+    def __init__(self, chat_latency="fixed:0.5", image_latency="fixed:2", error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, token_interval=0.03):
+        self.chat_latency = parse_latency(chat_latency)
+        self.token_interval = token_interval
+        self.image_latency = parse_latency(image_latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+
+class MockStats:
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+_png_cache = {}
+_png_lock = threading.Lock()
+
+
+def solid_png(width, height):
+    with _png_lock:
+        if (width, height) not in _png_cache:
+            color = tuple(random.randrange(256) for _ in range(3))
+            buffered = BytesIO()
+            Image.new("RGB", (width, height), color).save(buffered, format="PNG")
+            _png_cache[(width, height)] = buffered.getvalue()
+        return _png_cache[(width, height)]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _injected_failure(self, endpoint):
+        """Send a configured 429 or 500 instead of a result; True if one was sent"""
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self.server.stats.add(f"{endpoint}_429")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": str(self.config.retry_after)}
+            )
+            return True
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.server.stats.add(f"{endpoint}_500")
+            self._send_json(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self._chat(request)
+        elif self.path.endswith("/images/generations"):
+            self._images(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _chat(self, request):
+        time.sleep(self.config.chat_latency())
+        if self._injected_failure("chat"):
+            return
+        self.server.stats.add("chat")
+        user_message = request["messages"][-1]["content"]
+        content = (
+            "A cinematic, highly detailed scene: " + " ".join(user_message.split())[:400]
+        )
+        if request.get("stream"):
+            self._stream_chat(request, content)
+            return
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _stream_chat(self, request, content):
+        """Answer with server-sent chunks, one word per token interval"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.config.token_interval)
+            self._send_event({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if index == 0 else " " + word},
+                    "finish_reason": "stop" if index == len(words) - 1 else None
+                }]
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+    def _images(self, request):
+        time.sleep(self.config.image_latency())
+        if self._injected_failure("images"):
+            return
+        self.server.stats.add("images")
+        size = request.get("size", "1024x1024")
+        host, port = self.server.server_address[:2]
+        self._send_json(200, {
+            "created": int(time.time()),
+            "data": [{
+                "url": f"http://{host}:{port}/files/{uuid.uuid4().hex}-{size}.png",
+                "revised_prompt": request.get("prompt", "")
+            }]
+        })
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+            return
+        match = re.match(r"^/files/[0-9a-f]+-(\d+)x(\d+)\.png$", self.path)
+        if not match:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        self.server.stats.add("downloads")
+        body = solid_png(int(match.group(1)), int(match.group(2)))
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread and return it"""
+    server = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.stats = MockStats()
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-openai").start()
+    return server
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--chat-latency", default="lognormal:2,0.4", help="chat completion latency spec")
+    parser.add_argument("--image-latency", default="lognormal:12,0.3", help="image generation latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--token-interval", type=float, default=0.03, help="seconds between streamed chat tokens")
+
+
+def config_from_args(args):
+    return MockConfig(
+        chat_latency=args.chat_latency,
+        image_latency=args.image_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        token_interval=args.token_interval
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(config_from_args(args), args.host, args.port)
+    print(f"Mock OpenAI listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import pytest
+
+from batch import read_rows, validate_row
+
+OPTIONS = {
+    "hobby_category": {"ხელოვნება": {"ხატვა": "painting", "მუსიკა": "music"}},
+    "color": {"ლურჯი": "blue"},
+    "style": {"რეალისტური": "realistic"},
+    "mood": {"მშვიდი": "calm"},
+    "filter": {"არცერთი": "none"},
+}
+
+ROW = {
+    "name": "Ana", "age": "30", "hobby_category": "", "hobby": "music",
+    "color": "blue", "style": " რეალისტური", "mood": "calm", "filter": "none",
+}
+
+
+def test_accepts_english_names_and_looks_up_the_category():
+    assert validate_row(ROW, OPTIONS) == {
+        "name": "Ana", "age": 30, "hobby_category": "ხელოვნება", "hobby": "მუსიკა",
+        "color": "ლურჯი", "style": "რეალისტური", "mood": "მშვიდი", "filter": "არცერთი",
+    }
+
+
+@pytest.mark.parametrize("row, error", [
+    ([ROW], "expected an object"),
+    ("Ana", "expected an object"),
+    (dict(ROW, name=" "), "missing name"),
+    (dict(ROW, age="thirty"), "is not a number"),
+    (dict(ROW, age=[30]), "is not a number"),
+    (dict(ROW, age=120), "outside 5-100"),
+    (dict(ROW, color="plaid"), "color: unknown value 'plaid'"),
+    (dict(ROW, hobby="chess"), "hobby: unknown value 'chess'"),
+])
+def test_rejects_bad_rows(row, error):
+    with pytest.raises(ValueError, match=error):
+        validate_row(row, OPTIONS)
+
+
+def test_reads_malformed_jsonl_lines_as_errors(tmp_path):
+    path = tmp_path / "profiles.jsonl"
+    path.write_text('{"name": "Ana"}\n{"name": \n\n[1, 2]\n', encoding="utf-8")
+    rows = read_rows(str(path))
+    assert [(line_no, row) for line_no, row, _ in rows] == [(1, {"name": "Ana"}), (2, None), (4, [1, 2])]
+    assert [error is None for _, _, error in rows] == [True, False, True]
+    assert rows[1][2].startswith("not valid JSON")
+
+
+def test_reads_csv_rows_with_their_file_line(tmp_path):
+    path = tmp_path / "profiles.csv"
+    path.write_text("name,age\nAna,30\nGio,41\n", encoding="utf-8")
+    assert read_rows(str(path)) == [
+        (2, {"name": "Ana", "age": "30"}, None),
+        (3, {"name": "Gio", "age": "41"}, None),
+    ]
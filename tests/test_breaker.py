@@ -0,0 +1,124 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from weart.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from weart.ratelimit import DeadlineExceeded, KeyGovernor
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def make_breaker(**options):
+    options = {"window": 4, "min_calls": 2, "failure_rate": 0.5, "open_seconds": 0.05, **options}
+    return CircuitBreaker("test", **options)
+
+
+def status_error(error_class, status_code):
+    return error_class("error", response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+def raising(error):
+    def fn():
+        raise error
+    return fn
+
+
+def test_opens_once_the_failure_rate_is_reached():
+    breaker = make_breaker()
+    assert breaker.allow()
+    breaker.success(0.1)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_waits_for_min_calls_before_opening():
+    breaker = make_breaker(min_calls=3)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+
+
+def test_slow_success_counts_as_failure():
+    breaker = make_breaker(slow_seconds=1.0)
+    breaker.success(2.0)
+    breaker.success(2.0)
+    assert breaker.state == OPEN
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = make_breaker(probes=1)
+    breaker.failure()
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_ignored_probe_frees_its_slot():
+    breaker = make_breaker(probes=1)
+    breaker.failure()
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.ignore()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("error", [
+    openai.APITimeoutError(request=REQUEST),
+    openai.APIConnectionError(request=REQUEST),
+    status_error(openai.InternalServerError, 503),
+])
+def test_governor_counts_upstream_failures(error):
+    breaker = make_breaker()
+    governor = KeyGovernor({"chat": 600}, max_concurrent=1, max_attempts=1)
+    for _ in range(2):
+        with pytest.raises(type(error)):
+            governor.call("chat", raising(error), breaker=breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        governor.call("chat", lambda: None, breaker=breaker)
+
+
+@pytest.mark.parametrize("error", [
+    DeadlineExceeded("Prompt expansion passed its deadline"),
+    status_error(openai.RateLimitError, 429),
+    status_error(openai.BadRequestError, 400),
+])
+def test_governor_ignores_local_and_request_errors(error):
+    breaker = make_breaker()
+    governor = KeyGovernor({"chat": 600}, max_concurrent=1, max_attempts=1)
+    for _ in range(4):
+        with pytest.raises(type(error)):
+            governor.call("chat", raising(error), breaker=breaker)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 0
+
+
+def test_governor_ignores_a_missed_token_deadline():
+    breaker = make_breaker(probes=1)
+    breaker.failure()
+    breaker.failure()
+    time.sleep(0.06)
+    governor = KeyGovernor({"chat": 600}, max_concurrent=1)
+    governor.buckets["chat"].pause(5)
+    with pytest.raises(DeadlineExceeded):
+        governor.call("chat", lambda: None, deadline=time.monotonic() + 0.5, breaker=breaker)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
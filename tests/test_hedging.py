@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from weart.hedging import HedgeCancelled, Hedger, LatencyWindow
+
+
+def make_hedger():
+    hedger = Hedger(quantile=0.5, min_samples=1, max_in_flight=1, max_workers=4)
+    hedger.call("hd", lambda cancelled: "warm-up")
+    return hedger
+
+
+def test_window_quantile_needs_min_samples():
+    window = LatencyWindow(size=10)
+    window.add(1.0)
+    assert window.quantile(0.9, min_samples=2) is None
+    for seconds in (2.0, 3.0, 4.0):
+        window.add(seconds)
+    assert window.quantile(0.5, min_samples=2) == 3.0
+
+
+def test_hedge_wins_and_cancels_the_queued_primary():
+    hedger = make_hedger()
+    primary_turn = threading.Event()
+    primary_done = threading.Event()
+    lock = threading.Lock()
+    attempts = []
+    sent = []
+
+    def attempt(cancelled):
+        with lock:
+            attempts.append(cancelled)
+            first = len(attempts) == 1
+        if first:
+            # The first attempt is still waiting for its turn on the key
+            try:
+                primary_turn.wait(2)
+                if cancelled.is_set():
+                    raise HedgeCancelled()
+                sent.append("primary")
+                return "primary"
+            finally:
+                primary_done.set()
+        sent.append("hedge")
+        return "hedge"
+
+    assert hedger.call("hd", attempt, deadline=time.monotonic() + 2) == "hedge"
+    assert all(cancelled.is_set() for cancelled in attempts)
+    primary_turn.set()
+    assert primary_done.wait(2)
+    assert sent == ["hedge"]
+
+
+def test_no_hedge_before_enough_samples():
+    hedger = Hedger(quantile=0.5, min_samples=5, max_in_flight=1)
+    calls = []
+
+    def attempt(cancelled):
+        calls.append(cancelled)
+        time.sleep(0.05)
+        return "primary"
+
+    assert hedger.call("hd", attempt) == "primary"
+    assert len(calls) == 1
+
+
+def test_deadline_raises_and_cancels_every_attempt():
+    hedger = make_hedger()
+    attempts = []
+    release = threading.Event()
+
+    def attempt(cancelled):
+        attempts.append(cancelled)
+        release.wait(2)
+
+    try:
+        with pytest.raises(TimeoutError):
+            hedger.call("hd", attempt, deadline=time.monotonic() + 0.1)
+        assert len(attempts) == 2
+        assert all(cancelled.is_set() for cancelled in attempts)
+    finally:
+        release.set()
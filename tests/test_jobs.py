@@ -0,0 +1,66 @@
+import json
+import time
+
+from weart.db import ConnectionPool, migrate
+from weart.jobs import JobQueue
+from weart.state import SQLiteState
+
+
+def make_pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "users.db"))
+    migrate(pool)
+    return pool
+
+
+def make_queue(pool, runs):
+    def runner(job, checkpoint, publish):
+        runs.append(job['id'])
+        return {"image_url": "https://example.com/image.png"}
+
+    queue = JobQueue(runner, pool, max_workers=2, state=SQLiteState(pool))
+    queue.state.set(f"worker:{queue.worker_id}", time.time(), ttl=60)
+    return queue
+
+
+def add_job(pool, job_id, worker, status="queued"):
+    pool.execute(
+        "INSERT INTO jobs (id, username, user_data, status, worker) VALUES (?, ?, ?, ?, ?)",
+        (job_id, "demo", json.dumps({"name": "Ana"}), status, worker)
+    )
+
+
+def wait_for_status(queue, job_id, status, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while queue.get(job_id)['status'] != status:
+        assert time.monotonic() < deadline, f"job {job_id} never became {status}"
+        time.sleep(0.01)
+
+
+def test_resumes_only_jobs_of_dead_workers(tmp_path):
+    pool = make_pool(tmp_path)
+    runs = []
+    live = make_queue(pool, [])
+    add_job(pool, "dead", "gone-worker", status="running")
+    add_job(pool, "orphan", None)
+    add_job(pool, "alive", live.worker_id)
+    add_job(pool, "finished", "gone-worker", status="done")
+
+    queue = make_queue(pool, runs)
+    assert queue.resume_pending() == 2
+    wait_for_status(queue, "dead", "done")
+    wait_for_status(queue, "orphan", "done")
+    assert sorted(runs) == ["dead", "orphan"]
+    assert queue.get("alive")['status'] == "queued"
+    assert queue.get("dead")['worker'] == queue.worker_id
+
+
+def test_a_dead_workers_job_is_claimed_once(tmp_path):
+    pool = make_pool(tmp_path)
+    add_job(pool, "dead", "gone-worker", status="running")
+    first_runs, second_runs = [], []
+    first = make_queue(pool, first_runs)
+    second = make_queue(pool, second_runs)
+
+    assert first.resume_pending() + second.resume_pending() == 1
+    wait_for_status(first, "dead", "done")
+    assert len(first_runs + second_runs) == 1
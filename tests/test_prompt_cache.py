@@ -0,0 +1,36 @@
+from weart.db import ConnectionPool, migrate
+from weart.prompt_cache import PromptCache
+
+
+def make_cache(tmp_path, variants=3):
+    pool = ConnectionPool(str(tmp_path / "users.db"))
+    migrate(pool)
+    return PromptCache(pool, variants=variants)
+
+
+def variants(cache, key):
+    return sorted(tuple(row) for row in cache.db.query_all(
+        "SELECT variant, template FROM prompt_cache WHERE cache_key = ?", (key,)
+    ))
+
+
+def test_refills_a_variant_slot_freed_by_eviction(tmp_path):
+    cache = make_cache(tmp_path)
+    for index in range(3):
+        cache.put("k", f"t{index}")
+    assert cache.get("k") in {"t0", "t1", "t2"}
+
+    cache.db.execute("DELETE FROM prompt_cache WHERE cache_key = 'k' AND variant = 0")
+    assert cache.get("k") is None
+
+    cache.put("k", "new")
+    assert variants(cache, "k") == [(0, "new"), (1, "t1"), (2, "t2")]
+    assert cache.get("k") in {"new", "t1", "t2"}
+
+
+def test_replaces_the_oldest_variant_when_full(tmp_path):
+    cache = make_cache(tmp_path)
+    for index in range(3):
+        cache.put("k", f"t{index}")
+    cache.put("k", "t3")
+    assert variants(cache, "k") == [(0, "t3"), (1, "t1"), (2, "t2")]
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from weart.ratelimit import DeadlineExceeded, FairGate, KeyGovernor, TokenBucket, current_session
+
+
+def in_session(session_id, fn):
+    def run():
+        current_session.set(session_id)
+        fn()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_bucket_spaces_calls_beyond_the_burst():
+    bucket = TokenBucket(60, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_refunded_token_can_be_taken_again():
+    bucket = TokenBucket(6, burst=1)
+    assert bucket.reserve() == 0.0
+    bucket.refund()
+    assert bucket.reserve() == pytest.approx(0.0, abs=0.05)
+
+
+def test_gate_serves_waiting_sessions_round_robin():
+    gate = FairGate(1)
+    gate.acquire("holder")
+    order = []
+
+    def take(name):
+        def run():
+            gate.acquire(current_session.get())
+            order.append(name)
+            gate.release()
+        return run
+
+    threads = []
+    for session_id, name in (("a", "a1"), ("a", "a2"), ("b", "b1")):
+        threads.append(in_session(session_id, take(name)))
+        wait_until(lambda: gate.waiting() == len(threads))
+    gate.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["a1", "b1", "a2"]
+
+
+def test_token_wait_does_not_hold_a_call_slot():
+    governor = KeyGovernor({"chat": 600, "images": 600}, max_concurrent=1)
+    governor.buckets["images"].pause(0.5)
+    finished = {}
+
+    def call(endpoint):
+        def run():
+            governor.call(endpoint, lambda: None)
+            finished[endpoint] = time.monotonic()
+        return run
+
+    started = time.monotonic()
+    image = in_session("a", call("images"))
+    time.sleep(0.05)
+    chat = in_session("b", call("chat"))
+    chat.join()
+    image.join()
+    assert finished["chat"] - started < 0.3
+    assert finished["chat"] < finished["images"]
+
+
+def test_token_past_the_deadline_raises_instead_of_sleeping():
+    governor = KeyGovernor({"images": 600}, max_concurrent=1)
+    governor.buckets["images"].pause(5)
+    called = []
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        governor.call("images", lambda: called.append(True), deadline=time.monotonic() + 0.5)
+    assert time.monotonic() - started < 0.2
+    assert not called
+    assert governor.gate.active == 0
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from weart.singleflight import SingleFlight
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_waiters_share_the_result():
+    flight = SingleFlight()
+    results = []
+
+    def follow():
+        results.append(flight.do("k", lambda: "other"))
+
+    followers = [threading.Thread(target=follow) for _ in range(2)]
+
+    def lead():
+        for thread in followers:
+            thread.start()
+        wait_until(lambda: flight.stats()["coalesced"] == 2)
+        return "value"
+
+    assert flight.do("k", lead) == ("value", False)
+    for thread in followers:
+        thread.join()
+    assert results == [("value", True), ("value", True)]
+    assert flight.stats() == {"calls": 3, "executed": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_error_reaches_every_waiter_and_frees_the_key():
+    flight = SingleFlight()
+    errors = []
+
+    def follow():
+        try:
+            flight.do("k", lambda: "other")
+        except ValueError as e:
+            errors.append(e)
+
+    followers = [threading.Thread(target=follow) for _ in range(2)]
+
+    def lead():
+        for thread in followers:
+            thread.start()
+        wait_until(lambda: flight.stats()["coalesced"] == 2)
+        raise ValueError("upstream failed")
+
+    with pytest.raises(ValueError, match="upstream failed"):
+        flight.do("k", lead)
+    for thread in followers:
+        thread.join()
+    assert [str(e) for e in errors] == ["upstream failed", "upstream failed"]
+    assert flight.stats()["in_flight"] == 0
+    assert flight.do("k", lambda: "retried") == ("retried", False)
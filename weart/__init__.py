@@ -0,0 +1,7 @@
+"""Core of the WeArt kiosk: accounts, prompt and image generation, storage
+
+Nothing here imports Streamlit, so batch tools and tests can use the package
+directly; app.py is the Streamlit front-end over it. Heavy dependencies
+(openai, PIL, qrcode, requests) are imported on first use rather than at
+import time.
+"""
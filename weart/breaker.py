@@ -0,0 +1,154 @@
+"""Circuit breakers for the upstream generation paths
+
+Each path (the chat endpoint per model, the images endpoint per tier) has a
+CircuitBreaker that watches its last `window` calls. A call counts as failed
+when the upstream errored or a sent request timed out, or when it took
+longer than `slow_seconds`; calls that only ran out of the kiosk's own
+deadline are not counted. Once at least `min_calls` were seen and the failed share
+reaches `failure_rate`, the circuit opens: for `open_seconds` calls are
+refused without being sent, so the generation code moves on to its
+fallbacks (a smaller chat model, the local templates, a cheaper image tier)
+instead of queueing behind a failing upstream.
+
+After the cool-down the circuit is half open and lets `probes` calls
+through. A successful probe closes it, a failed one opens it again; probes
+that have not reported back within another `open_seconds` are written off.
+Breakers are per process; each replica notices an outage on its own within
+a few calls.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from . import settings
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, slow_seconds=None, open_seconds=30,
+                 probes=1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = 0
+        self._probes_expire = 0.0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        self._outcomes.clear()
+        self._probing = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        REGISTRY.inc("weart_circuit_transitions_total", circuit=self.name, state=state)
+        log = logger.info if state == CLOSED else logger.warning
+        log(f"Circuit {self.name} is now {state}")
+
+    def _cooled_down(self):
+        return time.monotonic() - self._opened_at >= self.open_seconds
+
+    def _probe_free(self):
+        if self._probing >= self.probes and time.monotonic() >= self._probes_expire:
+            self._probing = 0
+        return self._probing < self.probes
+
+    def available(self):
+        """Whether allow() would currently let a call through"""
+        with self._lock:
+            if self.state == OPEN:
+                return self._cooled_down()
+            return self.state == CLOSED or self._probe_free()
+
+    def allow(self):
+        """Admit one call; every admitted call must end in success, failure or ignore"""
+        with self._lock:
+            if self.state == OPEN and self._cooled_down():
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probe_free():
+                self._probing += 1
+                self._probes_expire = time.monotonic() + self.open_seconds
+                return True
+        REGISTRY.inc("weart_circuit_rejections_total", circuit=self.name)
+        return False
+
+    def success(self, seconds):
+        self._record(self.slow_seconds is None or seconds <= self.slow_seconds)
+
+    def failure(self):
+        self._record(False)
+
+    def ignore(self):
+        """End an admitted call whose outcome says nothing about the upstream, e.g. a bad request"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = max(0, self._probing - 1)
+
+    def _record(self, ok):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if ok else OPEN)
+            elif self.state == CLOSED:
+                # Results of calls admitted before the circuit opened are dropped
+                self._outcomes.append(ok)
+                failed = self._outcomes.count(False)
+                if len(self._outcomes) >= self.min_calls and failed / len(self._outcomes) >= self.failure_rate:
+                    self._transition(OPEN)
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "circuit": self.name,
+                "state": self.state,
+                "calls": calls,
+                "failure_rate": round(self._outcomes.count(False) / calls, 2) if calls else 0.0,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, slow_seconds=None):
+    """Return the process-wide breaker for name, or None if breakers are off"""
+    if not settings.BREAKER_ENABLED:
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=settings.BREAKER_WINDOW,
+                min_calls=settings.BREAKER_MIN_CALLS,
+                failure_rate=settings.BREAKER_FAILURE_RATE,
+                slow_seconds=slow_seconds,
+                open_seconds=settings.BREAKER_OPEN_SECONDS,
+                probes=settings.BREAKER_HALF_OPEN_PROBES
+            )
+        return breaker
+
+
+def breaker_stats():
+    """stats() of every breaker created so far, for the admin page"""
+    with _breakers_lock:
+        breakers = sorted(_breakers.values(), key=lambda breaker: breaker.name)
+    return [breaker.stats() for breaker in breakers]
@@ -0,0 +1,87 @@
+"""Options offered on the input page and their English translations
+
+The Georgian names are what users pick and what is stored in user_data;
+the English values are what goes into the prompts.
+"""
+
+hobbies = {
+    "სპორტი": {
+        "ფეხბურთი": "football",
+        "კალათბურთი": "basketball",
+        "ჭადრაკი": "chess",
+        "ცურვა": "swimming",
+        "იოგა": "yoga",
+        "ჩოგბურთი": "tennis",
+        "სირბილი": "running"
+    },
+    "ხელოვნება": {
+        "ხატვა": "painting",
+        "მუსიკა": "music",
+        "ცეკვა": "dancing",
+        "ფოტოგრაფია": "photography",
+        "კერამიკა": "ceramics",
+        "ქარგვა": "embroidery"
+    },
+    "ტექნოლოგია": {
+        "პროგრამირება": "programming",
+        "გეიმინგი": "gaming",
+        "რობოტიკა": "robotics",
+        "3D მოდელირება": "3D modeling",
+        "AI": "artificial intelligence"
+    },
+    "ბუნება": {
+        "მებაღეობა": "gardening",
+        "ლაშქრობა": "hiking",
+        "კემპინგი": "camping",
+        "ალპინიზმი": "mountain climbing"
+    }
+}
+
+colors = {
+    "წითელი": "red",
+    "ლურჯი": "blue",
+    "მწვანე": "green",
+    "ყვითელი": "yellow",
+    "იისფერი": "purple",
+    "ოქროსფერი": "gold",
+    "ვერცხლისფერი": "silver",
+    "ცისფერი": "light blue"
+}
+
+styles = {
+    "რეალისტური": "realistic",
+    "ფანტასტიკური": "fantastic",
+    "მულტიპლიკაციური": "cartoon",
+    "ანიმე": "anime",
+    "იმპრესიონისტული": "impressionistic"
+}
+
+moods = {
+    "მხიარული": "cheerful",
+    "მშვიდი": "peaceful",
+    "ენერგიული": "energetic",
+    "რომანტიული": "romantic",
+    "სათავგადასავლო": "adventurous",
+    "ნოსტალგიური": "nostalgic"
+}
+
+filters = {
+    "ბუნებრივი": "natural",
+    "რეტრო": "retro",
+    "დრამატული": "dramatic",
+    "ნათელი": "bright",
+    "კონტრასტული": "high contrast"
+}
+
+
+def translate_user_data(user_data):
+    """Translate Georgian user data to English"""
+    return {
+        "name": user_data['name'],
+        "age": user_data['age'],
+        "hobby": hobbies[user_data['hobby_category']][user_data['hobby']],
+        "color": colors[user_data['color']],
+        "style": styles[user_data['style']],
+        "mood": moods[user_data['mood']],
+        "filter": filters[user_data['filter']]
+    }
@@ -0,0 +1,140 @@
+"""Shared OpenAI clients
+
+One client per API key is kept for the life of the process, so reruns and
+concurrent sessions reuse the same keep-alive HTTP connection pool instead
+of building a new client every time. Clients that have not been used for a
+while are closed and dropped. Every call through the per-key governor holds
+a lease on the key's client, so a client kept by a long-running caller such
+as batch.py is never closed while it is still making calls.
+"""
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """Thread-safe registry of OpenAI clients keyed by API key"""
+
+    def __init__(self, idle_seconds=900, max_connections=20, keepalive_seconds=60):
+        self.idle_seconds = idle_seconds
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key_id(api_key):
+        # Only a digest of the key is kept as the dictionary key
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    def _create(self, api_key):
+        # openai and httpx take a noticeable share of cold start; load them on first use
+        import httpx
+        from openai import OpenAI
+
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_seconds
+            )
+        )
+        # Retries are handled by the per-key governor in ratelimit.py
+        return OpenAI(
+            api_key=api_key,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+            max_retries=0
+        )
+
+    def get(self, api_key):
+        """Return the shared client for api_key, creating it on first use"""
+        key_id = self._key_id(api_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key_id)
+            if entry is None:
+                entry = self._clients[key_id] = [self._create(api_key), now, 0]
+            entry[1] = now
+            idle = self._pop_idle(now)
+        for client in idle:
+            client.close()
+        return entry[0]
+
+    def _pop_idle(self, now):
+        idle_ids = [
+            key_id for key_id, (_, last_used, leases) in self._clients.items()
+            if not leases and now - last_used > self.idle_seconds
+        ]
+        if idle_ids:
+            logger.info(f"Closing {len(idle_ids)} idle OpenAI client(s)")
+        return [self._clients.pop(key_id)[0] for key_id in idle_ids]
+
+    @contextmanager
+    def lease(self, api_key):
+        """Mark the key's client as in use for the duration of the block"""
+        key_id = self._key_id(api_key)
+        with self._lock:
+            entry = self._clients.get(key_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                entry[2] += 1
+        try:
+            yield
+        finally:
+            if entry is not None:
+                with self._lock:
+                    entry[1] = time.monotonic()
+                    entry[2] -= 1
+
+    def evict_idle(self):
+        """Close clients that have been idle longer than idle_seconds"""
+        with self._lock:
+            idle = self._pop_idle(time.monotonic())
+        for client in idle:
+            client.close()
+        return len(idle)
+
+    def start_eviction(self):
+        """Evict idle clients in the background, also while no client is requested"""
+        def run():
+            while True:
+                time.sleep(max(1.0, self.idle_seconds / 3))
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    logger.error(f"OpenAI client eviction error: {str(e)}")
+
+        threading.Thread(target=run, name="client-eviction", daemon=True).start()
+        return self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_client_registry():
+    """Return the process-wide client registry configured from settings"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry(
+                idle_seconds=settings.OPENAI_CLIENT_IDLE_SECONDS,
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                keepalive_seconds=settings.OPENAI_KEEPALIVE_SECONDS
+            ).start_eviction()
+        return _default_registry
+
+
+def get_client(api_key):
+    return get_client_registry().get(api_key)
@@ -0,0 +1,273 @@
+"""SQLite access layer for users.db
+
+All queries go through a bounded pool of long-lived connections opened in
+WAL mode, so readers no longer block the writer and connection setup is paid
+once per connection instead of once per query. Connections run in autocommit
+mode; multi-statement writes use transaction(), which takes the write lock
+up front (BEGIN IMMEDIATE) so concurrent writers wait on the busy timeout
+instead of failing on a lock upgrade. sqlite3 keeps compiled statements per
+connection, so the constant SQL strings used throughout are prepared once.
+
+Schema changes are applied by numbered migrations tracked in PRAGMA
+user_version; add new tables by appending to MIGRATIONS.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from . import settings
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    (1, "users table", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            api_key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "generation jobs", [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            user_data TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_username_status ON jobs (username, status)",
+    ]),
+    (3, "prompt cache", [
+        '''
+        CREATE TABLE IF NOT EXISTS prompt_cache (
+            cache_key TEXT NOT NULL,
+            variant INTEGER NOT NULL,
+            template TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cache_key, variant)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_prompt_cache_last_used ON prompt_cache (last_used_at)",
+    ]),
+    (4, "generation history", [
+        '''
+        CREATE TABLE IF NOT EXISTS generations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            job_id TEXT UNIQUE,
+            user_data TEXT NOT NULL,
+            english_prompt TEXT,
+            image_id TEXT,
+            image_url TEXT,
+            timings TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_generations_username_created ON generations (username, created_at)",
+    ]),
+    (5, "job deduplication key", [
+        "ALTER TABLE jobs ADD COLUMN dedupe_key TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (username, dedupe_key, status)",
+    ]),
+    (6, "job session", [
+        "ALTER TABLE jobs ADD COLUMN session_id TEXT",
+    ]),
+    (7, "short links", [
+        '''
+        CREATE TABLE IF NOT EXISTS short_links (
+            id TEXT PRIMARY KEY,
+            image_id TEXT,
+            target_url TEXT,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_short_links_image ON short_links (image_id)",
+    ]),
+    (8, "login sessions", [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+    ]),
+    (9, "shared state and job ownership", [
+        '''
+        CREATE TABLE IF NOT EXISTS shared_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_shared_state_expires ON shared_state (expires_at)",
+        "ALTER TABLE jobs ADD COLUMN worker TEXT",
+    ]),
+    (10, "pre-generated image pool", [
+        '''
+        CREATE TABLE IF NOT EXISTS combo_popularity (
+            combo_key TEXT PRIMARY KEY,
+            user_data TEXT NOT NULL,
+            score REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS image_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            combo_key TEXT NOT NULL,
+            english_prompt TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            image_url TEXT,
+            tier TEXT,
+            cost REAL NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'ready',
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_image_pool_combo ON image_pool (combo_key, status)",
+        "CREATE INDEX IF NOT EXISTS idx_image_pool_created ON image_pool (created_at)",
+    ]),
+    (11, "image pool spend ledger", [
+        '''
+        CREATE TABLE IF NOT EXISTS pool_spend (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cost REAL NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_pool_spend_created ON pool_spend (created_at)",
+    ]),
+]
+
+
+class ConnectionPool:
+    """Bounded pool of WAL-mode SQLite connections shared across threads"""
+
+    def __init__(self, db_path, size=8, busy_timeout_ms=5000, cached_statements=256):
+        self.db_path = db_path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=self.busy_timeout_ms / 1000)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block"""
+        started = time.perf_counter()
+        conn = self._acquire()
+        REGISTRY.observe("weart_db_pool_wait_seconds", time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in a write transaction, committing on success"""
+        with self.connection() as conn, REGISTRY.span("db", op="transaction"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def execute(self, sql, params=()):
+        """Run a single write statement and return its cursor"""
+        with self.connection() as conn, REGISTRY.span("db", op="execute"):
+            return conn.execute(sql, params)
+
+    def query_one(self, sql, params=()):
+        with self.connection() as conn, REGISTRY.span("db", op="query"):
+            return conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        with self.connection() as conn, REGISTRY.span("db", op="query"):
+            return conn.execute(sql, params).fetchall()
+
+
+def migrate(pool):
+    """Apply pending migrations and return the resulting schema version"""
+    with pool.transaction() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info(f"Applying database migration {number}: {description}")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(number)}")
+            version = number
+    return version
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_db():
+    """Return the process-wide pool for settings.DB_PATH, migrating it on first use"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            pool = ConnectionPool(
+                settings.DB_PATH,
+                size=settings.DB_POOL_SIZE,
+                busy_timeout_ms=settings.DB_BUSY_TIMEOUT_MS
+            )
+            migrate(pool)
+            _default_pool = pool
+        return _default_pool
@@ -0,0 +1,690 @@
+"""Prompt, image and QR generation, independent of the Streamlit UI
+
+run_generation_pipeline() takes user_data from the input page through every
+generation stage. The kiosk runs it on the job queue via run_generation_job(),
+and batch.py calls it directly.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import settings
+from .breaker import CircuitOpen, get_breaker
+from .catalog import translate_user_data
+from .clients import get_client
+from .hedging import HedgeCancelled, get_hedger
+from .history import get_history
+from .image_pool import PoolWarmer, get_image_pool
+from .image_store import get_image_store, public_url
+from .metrics import REGISTRY, timed
+from .prompt_cache import (
+    get_prompt_cache, cache_key, age_group, fill_placeholders,
+    NAME_PLACEHOLDER, AGE_PLACEHOLDER
+)
+from .prompt_templates import build_template_prompt
+from .qr_codes import render_qr
+from .ratelimit import DeadlineExceeded, get_governor, current_session
+from .shortlinks import get_short_links, short_url
+from .singleflight import get_singleflight, request_key
+from .state import get_state
+from .users import get_user_api_key
+
+logger = logging.getLogger(__name__)
+
+
+@timed("create_qr_code")
+def create_qr_code(url, fmt=None):
+    """Create a QR code for the given URL as SVG markup or PNG bytes"""
+    try:
+        return render_qr(url, fmt or settings.QR_FORMAT, settings.QR_BOX_SIZE)
+    except Exception as e:
+        logger.error(f"QR code creation error: {str(e)}")
+        return None
+
+
+def _stream_chat(openai_client, on_text, deadline=None, **request):
+    """Run a streaming chat completion, passing the text so far to on_text
+
+    on_text is called at most every PROMPT_STREAM_INTERVAL seconds and once
+    more with the complete text. The client timeout only bounds each read,
+    so the stream is abandoned once it runs past deadline.
+    """
+    parts = []
+    last_sent = 0.0
+    for chunk in openai_client.chat.completions.create(stream=True, **request):
+        if deadline is not None and time.monotonic() > deadline:
+            raise DeadlineExceeded("Prompt expansion passed its deadline")
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            now = time.monotonic()
+            if now - last_sent >= settings.PROMPT_STREAM_INTERVAL:
+                on_text("".join(parts))
+                last_sent = now
+    text = "".join(parts)
+    on_text(text)
+    return text
+
+
+def chat_breaker(model):
+    return get_breaker(f"chat:{model}", settings.BREAKER_CHAT_SLOW_SECONDS)
+
+
+def image_breaker(tier):
+    return get_breaker(f"images:{tier}", settings.BREAKER_IMAGE_SLOW_SECONDS)
+
+
+def expand_prompt(eng_data, openai_client, placeholder_age_group=None, max_attempts=None, on_text=None,
+                  model=None):
+    """Ask the chat model (default CHAT_MODEL) to expand the translated choices into a detailed DALL-E prompt
+
+    With placeholder_age_group set, eng_data carries the [NAME]/[AGE]
+    placeholders and the model is asked to keep them for later substitution.
+    With on_text set, the reply is streamed and on_text receives the text
+    written so far. The call, retries included, has PROMPT_DEADLINE_SECONDS.
+    """
+    placeholder_note = ""
+    if placeholder_age_group:
+        placeholder_note = (
+            f"The person is a {placeholder_age_group}. Write {NAME_PLACEHOLDER} and "
+            f"{AGE_PLACEHOLDER} exactly as given wherever their name or age appear."
+        )
+
+    prompt_request = f"""
+    Create a detailed image prompt for a {eng_data['age']}-year-old named {eng_data['name']} 
+    who loves {eng_data['hobby']}. {placeholder_note}
+
+    Key elements to incorporate:
+    - Favorite color: {eng_data['color']}
+    - Visual style: {eng_data['style']}
+    - Mood: {eng_data['mood']}
+    - Filter effect: {eng_data['filter']}
+
+    Create a personalized, artistic scene that captures their interests and personality.
+    Focus on cinematic composition, dramatic lighting, and high-quality details.
+    Make it engaging and suitable for an expo demonstration.
+    Ensure the image is family-friendly and appropriate for all ages.
+    """
+
+    model = model or settings.CHAT_MODEL
+    request = dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are an expert at crafting detailed image generation prompts. Focus on creating vivid, specific descriptions that work well with DALL-E 3."},
+            {"role": "user", "content": prompt_request}
+        ],
+        temperature=0.7
+    )
+
+    deadline = time.monotonic() + settings.PROMPT_DEADLINE_SECONDS
+    governor = get_governor(openai_client.api_key)
+    breaker = chat_breaker(model)
+
+    def bounded_client():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Prompt expansion passed its deadline")
+        # A client that already has a shorter timeout, as in auto mode, keeps it
+        if isinstance(openai_client.timeout, (int, float)):
+            remaining = min(remaining, openai_client.timeout)
+        return openai_client.with_options(timeout=remaining)
+
+    if on_text is not None:
+        # The whole stream is read inside the governor slot; a retry starts the text over
+        return governor.call(
+            "chat", lambda: _stream_chat(bounded_client(), on_text, deadline=deadline, **request),
+            max_attempts=max_attempts, deadline=deadline, breaker=breaker
+        )
+
+    response = governor.call(
+        "chat",
+        lambda: bounded_client().chat.completions.create(**request),
+        max_attempts=max_attempts,
+        deadline=deadline,
+        breaker=breaker
+    )
+    return response.choices[0].message.content
+
+
+def create_georgian_summary(user_data):
+    """Summarize the chosen options in Georgian for display"""
+    return f"""🎨 რას ვქმნით: 
+    პერსონალიზებული სურათი {user_data['name']}-სთვის
+    • ჰობი: {user_data['hobby']}
+    • სტილი: {user_data['style']}
+    • განწყობა: {user_data['mood']}
+    • ფილტრი: {user_data['filter']}
+    """
+
+
+def expand_prompt_cached(eng_data, openai_client, max_attempts=None, on_text=None, model=None):
+    """Expand a prompt through the prompt cache when it is enabled"""
+    prompt_cache = get_prompt_cache()
+    if prompt_cache is None:
+        return expand_prompt(eng_data, openai_client, max_attempts=max_attempts, on_text=on_text, model=model)
+
+    key = cache_key(eng_data)
+    template = prompt_cache.get(key)
+    if template is None:
+        on_template_text = None
+        if on_text is not None:
+            on_template_text = lambda text: on_text(fill_placeholders(text, eng_data['name'], eng_data['age']))
+        template = expand_prompt(
+            {**eng_data, "name": NAME_PLACEHOLDER, "age": AGE_PLACEHOLDER},
+            openai_client,
+            placeholder_age_group=age_group(eng_data['age']),
+            max_attempts=max_attempts,
+            on_text=on_template_text,
+            model=model
+        )
+        prompt_cache.put(key, template)
+    return fill_placeholders(template, eng_data['name'], eng_data['age'])
+
+
+def expand_prompt_fallback(eng_data, openai_client, max_attempts=None, on_text=None):
+    """Expand with CHAT_MODEL, or with CHAT_FALLBACK_MODEL while the circuit of CHAT_MODEL is open
+
+    Raises CircuitOpen when no model's circuit lets the call through.
+    """
+    models = [settings.CHAT_MODEL] + ([settings.CHAT_FALLBACK_MODEL] if settings.CHAT_FALLBACK_MODEL else [])
+    for index, model in enumerate(models):
+        try:
+            return expand_prompt_cached(
+                eng_data, openai_client, max_attempts=max_attempts, on_text=on_text, model=model
+            )
+        except CircuitOpen:
+            if index + 1 == len(models):
+                raise
+            logger.warning(f"Circuit for {model} is open, expanding the prompt with {models[index + 1]}")
+            REGISTRY.inc("weart_fallbacks_total", path="chat", to=models[index + 1])
+
+
+@timed("create_personalized_prompt")
+def create_personalized_prompt(user_data, openai_client, on_text=None):
+    """Create a personalized English prompt based on translated user information
+
+    on_text, if given, receives the English prompt while GPT-4 is still
+    writing it (see PROMPT_STREAM). While the chat circuits are open the
+    local templates are used in every mode.
+    """
+    if not settings.PROMPT_STREAM:
+        on_text = None
+    try:
+        eng_data = translate_user_data(user_data)
+        georgian_summary = create_georgian_summary(user_data)
+
+        if settings.PROMPT_MODE == "template":
+            return build_template_prompt(eng_data), georgian_summary
+
+        if settings.PROMPT_MODE != "auto":
+            try:
+                english_prompt = expand_prompt_fallback(eng_data, openai_client, on_text=on_text)
+            except CircuitOpen as e:
+                logger.warning(f"{str(e)}, using template prompt")
+                REGISTRY.inc("weart_fallbacks_total", path="chat", to="template")
+                english_prompt = build_template_prompt(eng_data)
+            return english_prompt, georgian_summary
+
+        # Auto mode: a slow or failing GPT-4 call falls back to the local templates
+        try:
+            fast_client = openai_client.with_options(timeout=settings.PROMPT_GPT_TIMEOUT, max_retries=0)
+            english_prompt = expand_prompt_fallback(eng_data, fast_client, max_attempts=1, on_text=on_text)
+        except Exception as e:
+            logger.warning(f"GPT-4 prompt expansion failed, using template prompt: {str(e)}")
+            REGISTRY.inc("weart_fallbacks_total", path="chat", to="template")
+            english_prompt = build_template_prompt(eng_data)
+        return english_prompt, georgian_summary
+
+    except Exception as e:
+        logger.error(f"Error creating prompt: {str(e)}")
+        return None, None
+
+
+# DALL-E 3 options from quickest and cheapest to slowest
+IMAGE_TIERS = {
+    "fast": {"size": "1024x1024", "quality": "standard"},
+    "standard": {"size": "1792x1024", "quality": "standard"},
+    "hd": {"size": "1792x1024", "quality": "hd"},
+}
+# List prices per image, used for the pre-generation pool budget
+IMAGE_TIER_PRICES_USD = {"fast": 0.04, "standard": 0.08, "hd": 0.12}
+# Rough price of one GPT-4 prompt expansion, for the same budget
+PROMPT_PRICE_USD = 0.03
+
+_pinned_plan = None
+
+
+def image_plan():
+    """Return (tier, upgrade_tier) for new generations"""
+    plan = _pinned_plan or get_state().get("image_plan") or {
+        "tier": settings.IMAGE_TIER, "upgrade_tier": settings.IMAGE_UPGRADE_TIER
+    }
+    return plan['tier'], plan['upgrade_tier']
+
+
+def set_image_plan(tier, upgrade_tier=None, process_only=False):
+    """Switch tiers for new generations at runtime, e.g. from the admin page
+
+    The plan is shared with other replicas through the state backend;
+    process_only pins it for this process alone, as batch runs do.
+    """
+    global _pinned_plan
+    for name in (tier, upgrade_tier):
+        if name is not None and name not in IMAGE_TIERS:
+            raise ValueError(f"Unknown image tier: {name}")
+    if upgrade_tier == tier:
+        upgrade_tier = None
+    plan = {"tier": tier, "upgrade_tier": upgrade_tier}
+    if process_only:
+        _pinned_plan = plan
+    else:
+        get_state().set("image_plan", plan)
+
+
+@timed("generate_dalle_image")
+def generate_dalle_image(prompt, openai_client, tier=None):
+    """Generate image using DALL-E 3 at the given tier (default: the current plan)
+
+    The call, retries included, has IMAGE_DEADLINE_SECONDS; with IMAGE_HEDGE
+    a slow call is hedged with a second request. Nothing is sent while the
+    tier's circuit is open.
+    """
+    tier = tier or image_plan()[0]
+    options = IMAGE_TIERS[tier]
+    deadline = time.monotonic() + settings.IMAGE_DEADLINE_SECONDS
+    governor = get_governor(openai_client.api_key)
+
+    def attempt(cancelled=None):
+        def request():
+            if cancelled is not None and cancelled.is_set():
+                raise HedgeCancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("Image generation passed its deadline")
+            return openai_client.with_options(timeout=remaining).images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size=options['size'],
+                quality=options['quality'],
+                style="vivid",
+                n=1
+            )
+        return governor.call("images", request, deadline=deadline, breaker=image_breaker(tier)).data[0].url
+
+    try:
+        hedger = get_hedger()
+        if hedger is not None:
+            return hedger.call(tier, attempt, deadline=deadline)
+        return attempt()
+    except Exception as e:
+        logger.error(f"Error generating image: {str(e)}")
+        return None
+
+
+def fallback_tiers(tier):
+    """The IMAGE_FALLBACK_TIERS cheaper than tier, in their configured order"""
+    order = list(IMAGE_TIERS)
+    return [
+        name for name in settings.IMAGE_FALLBACK_TIERS
+        if name in IMAGE_TIERS and order.index(name) < order.index(tier)
+    ]
+
+
+def generate_image(prompt, openai_client, tier):
+    """Generate at tier, moving on to its fallback tiers while their circuits are open
+
+    Returns (image_url, tier used). A failure that leaves the circuit closed
+    does not try the next tier; image_url is None then, and also when every
+    circuit is open.
+    """
+    for candidate in [tier] + fallback_tiers(tier):
+        breaker = image_breaker(candidate)
+        if breaker is not None and not breaker.available():
+            continue
+        if candidate != tier:
+            logger.warning(f"Circuit for {tier} images is open, generating at {candidate}")
+            REGISTRY.inc("weart_fallbacks_total", path="images", to=candidate)
+        image_url = generate_dalle_image(prompt, openai_client, tier=candidate)
+        if image_url or breaker is None or breaker.available():
+            return image_url, candidate
+    logger.error(f"Circuits for {tier} images and its fallbacks are open")
+    return None, tier
+
+
+# Generation pipeline
+GENERATION_STAGES = [
+    ("prompt", "✍️ აღწერის შექმნა"),
+    ("image", "🎨 სურათის გენერაცია"),
+    ("store", "📥 სურათის შენახვა"),
+    ("qr", "📱 QR კოდის შექმნა"),
+    ("persist", "💾 შენახვა"),
+]
+
+
+def coalesced(stage, user_data, username, fn):
+    """Share the paid API call of a stage with identical requests already in flight"""
+    flight = get_singleflight()
+    if flight is None:
+        return fn()
+    key = request_key(user_data, username)
+    value, shared = flight.do((stage, key), fn)
+    if shared:
+        logger.info(f"Reused in-flight {stage} call for an identical request")
+    return value
+
+
+def _stage_prompt(result, ctx):
+    english_prompt, georgian_summary = coalesced(
+        "prompt", result['user_data'], ctx['username'],
+        lambda: create_personalized_prompt(result['user_data'], ctx['client'], on_text=ctx.get('on_text'))
+    )
+    result['english_prompt'] = english_prompt
+    result['georgian_summary'] = georgian_summary
+    return bool(english_prompt and georgian_summary)
+
+
+def _stage_image(result, ctx):
+    tier, upgrade_tier = image_plan()
+    # Identical choices can still get different cached prompt variants, and a
+    # shared image has to match the prompt stored with it
+    result['image_url'], result['tier'] = coalesced(
+        f"image:{tier}", {**result['user_data'], "english_prompt": result['english_prompt']}, ctx['username'],
+        lambda: generate_image(result['english_prompt'], ctx['client'], tier)
+    )
+    if result['tier'] != tier:
+        result['fallback_tier'] = tier
+    # Tells the visitor to come back later rather than retry at once
+    breaker = image_breaker(tier)
+    result['unavailable'] = not result['image_url'] and breaker is not None and not breaker.available()
+    if result['image_url'] and upgrade_tier:
+        result['upgrade'] = {"tier": upgrade_tier, "status": "pending"}
+    return bool(result['image_url'])
+
+
+def _stage_store(result, ctx):
+    if result.get('pool_image_id'):
+        # Pooled images are stored already; only the name caption is added
+        try:
+            result['image_id'] = get_image_store().caption(result['pool_image_id'], result['user_data']['name'])
+        except Exception as e:
+            logger.error(f"Error captioning pooled image: {str(e)}")
+            result['image_id'] = result['pool_image_id']
+        return True
+
+    # Without a local copy the UI falls back to the remote URL, so keep going
+    try:
+        result['image_id'] = get_image_store().ingest(
+            result['image_url'], timeout=settings.IMAGE_DOWNLOAD_TIMEOUT
+        )
+    except Exception as e:
+        logger.error(f"Error storing image: {str(e)}")
+        result['image_id'] = None
+    return True
+
+
+def _image_address(result):
+    """Public URL of the local copy, falling back to the remote image URL"""
+    if result.get('image_id'):
+        return public_url(result['image_id']) or result['image_url']
+    return result['image_url']
+
+
+def _stage_qr(result, ctx):
+    # A missing QR code is not worth failing an already paid-for image
+    qr_url = _image_address(result)
+    if settings.LINK_BASE_URL:
+        try:
+            result['short_id'] = get_short_links().create(result.get('image_id'), result['image_url'])
+            qr_url = short_url(result['short_id'])
+        except Exception as e:
+            logger.error(f"Short link creation error: {str(e)}")
+    # Only the URL is kept in the result; the page renders it through the QR cache
+    result['qr_url'] = qr_url if create_qr_code(qr_url) else None
+    return True
+
+
+def _stage_persist(result, ctx):
+    if ctx.get('persist'):
+        ctx['persist'](result)
+    return True
+
+
+STAGE_HANDLERS = {
+    "prompt": _stage_prompt,
+    "image": _stage_image,
+    "store": _stage_store,
+    "qr": _stage_qr,
+    "persist": _stage_persist,
+}
+
+
+def run_generation_pipeline(user_data, openai_client, on_stage=None, result=None, persist=None, username=None,
+                            on_text=None):
+    """Run the generation stages back to back and record how long each took
+
+    on_stage(index, stage, status, elapsed, result) is called when a stage
+    starts ("running") and when it ends ("done" or "failed"). on_text receives
+    the English prompt while it is being streamed. Passing the partial result
+    of an interrupted run skips the stages it already completed.
+    """
+    if result is None:
+        result = {"user_data": user_data}
+    result.setdefault('timings', {})
+    result.setdefault('completed', [])
+    result['failed_stage'] = None
+    ctx = {"client": openai_client, "persist": persist, "username": username, "on_text": on_text}
+
+    for index, (stage, _) in enumerate(GENERATION_STAGES):
+        if stage in result['completed']:
+            continue
+        if on_stage:
+            on_stage(index, stage, "running", 0.0, result)
+        started = time.perf_counter()
+        ok = STAGE_HANDLERS[stage](result, ctx)
+        elapsed = time.perf_counter() - started
+        result['timings'][stage] = elapsed
+        REGISTRY.observe("weart_stage_duration_seconds", elapsed, stage=stage, ok=str(ok).lower())
+        if ok:
+            result['completed'].append(stage)
+        else:
+            result['failed_stage'] = stage
+        if on_stage:
+            on_stage(index, stage, "done" if ok else "failed", elapsed, result)
+        if not ok:
+            break
+    return result
+
+
+def run_generation_job(job, checkpoint, publish):
+    """Job runner: execute the pipeline for a queued job, checkpointing every stage
+
+    The streamed prompt is published as live job state rather than checkpointed,
+    so it costs no database writes. A pending upgrade is marked in flight
+    here, before the queue marks the job done, so no reader sees a done job
+    without the marker and shows the preview as final.
+    """
+    api_key = get_user_api_key(job['username'])
+    if not api_key:
+        raise ValueError(f"No API key stored for {job['username']}")
+
+    def on_stage(index, stage, stage_status, elapsed, result):
+        checkpoint(stage, result)
+
+    current_session.set(job.get('session_id') or job['username'])
+    result = run_generation_pipeline(
+        job['user_data'],
+        get_client(api_key),
+        on_stage=on_stage,
+        result=job['result'] or None,
+        persist=lambda result: get_history().record(job['username'], job['id'], result),
+        username=job['username'],
+        on_text=lambda text: publish(english_prompt=text)
+    )
+    if not result['failed_stage'] and (result.get('upgrade') or {}).get('status') == 'pending':
+        get_state().set(f"job:{job['id']}:upgrading", True, ttl=UPGRADE_MARKER_TTL)
+    return result
+
+
+_upgrade_executor = None
+_upgrade_lock = threading.Lock()
+# Upper bound on the in-flight marker, in case the process rendering it dies
+UPGRADE_MARKER_TTL = 600
+
+
+def _get_upgrade_executor():
+    global _upgrade_executor
+    with _upgrade_lock:
+        if _upgrade_executor is None:
+            _upgrade_executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_UPGRADE_WORKERS, thread_name_prefix="upgrade"
+            )
+        return _upgrade_executor
+
+
+def upgrade_in_flight(job_id):
+    """True while a process is still rendering the job's upgrade
+
+    An upgrade left pending by a stopped process is not resumed; the
+    preview simply stays.
+    """
+    return bool(get_state().get(f"job:{job_id}:upgrading"))
+
+
+def upgrade_image(job, result, checkpoint):
+    """Render the pending upgrade tier of a finished job and swap it in
+
+    The job result, the gallery entry and the short link all move to the new
+    image. With a short link a QR code that was already scanned or shown
+    keeps working and now serves the new image; without one the QR code is
+    pointed at the new image, and the old one keeps serving the preview.
+    """
+    upgrade = result['upgrade']
+    api_key = get_user_api_key(job['username'])
+    # Upgrades queue behind interactive sessions' turns on the key, as one more session
+    current_session.set(f"upgrade:{job['username']}")
+    started = time.perf_counter()
+    image_url = generate_dalle_image(result['english_prompt'], get_client(api_key), tier=upgrade['tier'])
+    image_id = None
+    if image_url:
+        try:
+            image_id = get_image_store().ingest(image_url, timeout=settings.IMAGE_DOWNLOAD_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error storing upgraded image: {str(e)}")
+
+    elapsed = time.perf_counter() - started
+    REGISTRY.observe("weart_stage_duration_seconds", elapsed, stage="upgrade", ok=str(bool(image_url)).lower())
+    upgrade['seconds'] = elapsed
+    if not image_url:
+        upgrade['status'] = 'failed'
+        checkpoint("upgrade", result)
+        return
+
+    result['preview'] = {"tier": result.get('tier'), "image_id": result.get('image_id'),
+                         "image_url": result['image_url']}
+    result.update(tier=upgrade['tier'], image_id=image_id, image_url=image_url)
+    upgrade['status'] = 'done'
+    get_history().update_image(job['id'], image_id, image_url)
+    if result.get('short_id'):
+        get_short_links().retarget(result['short_id'], image_id, image_url)
+    elif result.get('qr_url'):
+        qr_url = _image_address(result)
+        result['qr_url'] = qr_url if create_qr_code(qr_url) else None
+    checkpoint("upgrade", result)
+
+
+def schedule_upgrade(job, result, checkpoint):
+    """JobQueue on_done hook: start a pending upgrade on the background pool
+
+    run_generation_job has already set the upgrade's in-flight marker.
+    """
+    if (result.get('upgrade') or {}).get('status') != 'pending':
+        return
+
+    def run():
+        try:
+            upgrade_image(job, result, checkpoint)
+        except Exception as e:
+            logger.error(f"Error upgrading image of job {job['id']}: {str(e)}")
+            result['upgrade']['status'] = 'failed'
+            checkpoint("upgrade", result)
+        finally:
+            get_state().delete(f"job:{job['id']}:upgrading")
+
+    _get_upgrade_executor().submit(run)
+
+
+# Stand-in for the visitor's name in pooled prompts; swapped for the real name when served
+POOL_SUBJECT = "the guest"
+
+
+def pool_tier():
+    """Pooled images are final, so they use the upgrade tier when there is one"""
+    tier, upgrade_tier = image_plan()
+    return upgrade_tier or tier
+
+
+def pregenerate(user_data, charge):
+    """Render a pool entry for the choices in user_data with the pool user's key
+
+    charge(cost) is called once the prompt and once the image are paid for.
+    """
+    api_key = get_user_api_key(settings.POOL_USER)
+    if not api_key:
+        logger.error(f"No API key stored for pool user {settings.POOL_USER}")
+        return None
+    client = get_client(api_key)
+    # The pool queues on the key like one more session, so visitors keep their turns
+    current_session.set("pool")
+    english_prompt, _ = create_personalized_prompt({**user_data, "name": POOL_SUBJECT}, client)
+    if not english_prompt:
+        return None
+    if settings.PROMPT_MODE != "template":
+        # Also charged when the prompt came from the cache or the templates; the budget errs high
+        charge(PROMPT_PRICE_USD)
+    tier = pool_tier()
+    image_url = generate_dalle_image(english_prompt, client, tier=tier)
+    if not image_url:
+        return None
+    # Charged before the download, which can still fail after the image was paid for
+    charge(IMAGE_TIER_PRICES_USD[tier])
+    image_id = get_image_store().ingest(image_url, timeout=settings.IMAGE_DOWNLOAD_TIMEOUT)
+    return {"english_prompt": english_prompt, "image_id": image_id, "image_url": image_url, "tier": tier}
+
+
+def take_pooled(user_data):
+    """Partial job result built from a pooled image for user_data, or None
+
+    The prompt and image stages are already complete; the store stage adds
+    the name caption.
+    """
+    pool = get_image_pool()
+    if pool is None:
+        return None
+    pool.record_pick(user_data)
+    entry = pool.take(user_data)
+    if entry is None:
+        return None
+    return {
+        "user_data": user_data,
+        "english_prompt": entry['english_prompt'].replace(POOL_SUBJECT, user_data['name']),
+        "georgian_summary": create_georgian_summary(user_data),
+        # The remote URL has usually expired by now, so point at the local copy when possible
+        "image_url": public_url(entry['image_id']) or entry['image_url'],
+        "pool_image_id": entry['image_id'],
+        "pool_entry_id": entry['id'],
+        "tier": entry['tier'],
+        "pooled": True,
+        "timings": {"prompt": 0.0, "image": 0.0},
+        "completed": ["prompt", "image"]
+    }
+
+
+def start_pool_warmer():
+    """Start the idle-time pool warmer, or return None if the pool is disabled"""
+    pool = get_image_pool()
+    if pool is None:
+        return None
+    return PoolWarmer(
+        pool, pregenerate, lambda: PROMPT_PRICE_USD + IMAGE_TIER_PRICES_USD[pool_tier()],
+        interval=settings.POOL_INTERVAL_SECONDS, idle_seconds=settings.POOL_IDLE_SECONDS
+    ).start()
@@ -0,0 +1,144 @@
+"""Hedged calls for the slow tail of image generation
+
+The Hedger keeps a window of recent latencies per kind of call (the image
+tier). A call still running once it passes the configured quantile of that
+window gets a twin request, and whichever succeeds first wins. At most
+`max_in_flight` hedges run at once, which caps the extra spend.
+
+The loser is cancelled if it is still waiting for its turn on the key. A
+request already on the wire cannot be aborted with the sync OpenAI client,
+so it runs into its deadline and its result is dropped.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import settings
+from .metrics import REGISTRY
+
+
+class HedgeCancelled(Exception):
+    """Raised by an attempt whose twin already won"""
+
+
+class LatencyWindow:
+    """The most recent latencies of one kind of call"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q, min_samples=1):
+        """The q quantile of the window, or None with fewer than min_samples"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Hedger:
+    def __init__(self, quantile=0.9, min_samples=20, max_in_flight=2, window=200, max_workers=32):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.window = window
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def _latencies(self, kind):
+        with self._lock:
+            window = self._windows.get(kind)
+            if window is None:
+                window = self._windows[kind] = LatencyWindow(self.window)
+            return window
+
+    def hedge_delay(self, kind):
+        """Seconds after which a call of kind is hedged, None until enough samples exist"""
+        return self._latencies(kind).quantile(self.quantile, self.min_samples)
+
+    def _attempt(self, kind, attempt, cancelled, hedge):
+        started = time.monotonic()
+        try:
+            value = attempt(cancelled)
+            self._latencies(kind).add(time.monotonic() - started)
+            return value
+        finally:
+            if hedge:
+                self._slots.release()
+
+    def _submit(self, kind, attempt, cancelled, hedge=False):
+        # Each attempt runs in a copy of the caller's context, so fair queueing
+        # on the key still sees the caller's session
+        return self._executor.submit(
+            contextvars.copy_context().run, self._attempt, kind, attempt, cancelled, hedge
+        )
+
+    def call(self, kind, attempt, deadline=None):
+        """Run attempt(cancelled), hedging it if it gets slow, and return the first success
+
+        attempt must check the cancelled event before sending its request.
+        deadline is a time.monotonic() value after which TimeoutError is raised.
+        """
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        primary_cancelled = threading.Event()
+        primary = self._submit(kind, attempt, primary_cancelled)
+        attempts = {primary: ("primary", primary_cancelled)}
+
+        delay = self.hedge_delay(kind)
+        if delay is not None:
+            wait([primary], timeout=delay if deadline is None else min(delay, remaining()))
+            if not primary.done() and remaining() != 0.0:
+                if self._slots.acquire(blocking=False):
+                    hedge_cancelled = threading.Event()
+                    hedge = self._submit(kind, attempt, hedge_cancelled, hedge=True)
+                    attempts[hedge] = ("hedge", hedge_cancelled)
+                else:
+                    REGISTRY.inc("weart_image_hedges_total", outcome="over_budget")
+
+        pending = set(attempts)
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"{kind} call passed its deadline")
+                for future in done:
+                    if future.exception() is None:
+                        if len(attempts) > 1:
+                            REGISTRY.inc("weart_image_hedges_total", outcome=f"{attempts[future][0]}_won")
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # Losers still waiting for their turn never send their request
+            for _, cancelled in attempts.values():
+                cancelled.set()
+
+
+_default_hedger = None
+_default_lock = threading.Lock()
+
+
+def get_hedger():
+    """Return the process-wide hedger for image calls, or None if hedging is off"""
+    global _default_hedger
+    if not settings.IMAGE_HEDGE:
+        return None
+    with _default_lock:
+        if _default_hedger is None:
+            _default_hedger = Hedger(
+                quantile=settings.IMAGE_HEDGE_QUANTILE,
+                min_samples=settings.IMAGE_HEDGE_MIN_SAMPLES,
+                max_in_flight=settings.IMAGE_HEDGE_MAX_IN_FLIGHT
+            )
+        return _default_hedger
@@ -0,0 +1,79 @@
+"""Per-user generation history
+
+Every finished generation is stored in the `generations` table of users.db
+together with its user_data, prompt, image reference and stage timings.
+The gallery reads it back one page at a time using keyset pagination on
+(created_at, id), so only the visible page is ever held in memory.
+"""
+import json
+import threading
+
+from . import db
+
+
+class GenerationHistory:
+    def __init__(self, db):
+        self.db = db
+
+    def record(self, username, job_id, result):
+        """Store a finished generation; recording the same job twice is a no-op"""
+        self.db.execute(
+            "INSERT OR IGNORE INTO generations "
+            "(username, job_id, user_data, english_prompt, image_id, image_url, timings) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                username,
+                job_id,
+                json.dumps(result['user_data'], ensure_ascii=False),
+                result.get('english_prompt'),
+                result.get('image_id'),
+                result.get('image_url'),
+                json.dumps(result.get('timings', {}))
+            )
+        )
+
+    def update_image(self, job_id, image_id, image_url):
+        """Point a recorded generation at a replacement image, e.g. its HD upgrade"""
+        self.db.execute(
+            "UPDATE generations SET image_id = ?, image_url = ? WHERE job_id = ?",
+            (image_id, image_url, job_id)
+        )
+
+    def page(self, username, limit, before=None):
+        """Return up to limit generations older than the before cursor, newest first
+
+        The returned cursor is None when there are no further pages.
+        """
+        query = "SELECT * FROM generations WHERE username = ?"
+        params = [username]
+        if before:
+            query += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params += [before[0], before[0], before[1]]
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self.db.query_all(query, params)
+
+        items = []
+        for row in rows[:limit]:
+            item = dict(row)
+            item['user_data'] = json.loads(item['user_data'])
+            item['timings'] = json.loads(item['timings']) if item['timings'] else {}
+            items.append(item)
+        cursor = None
+        if len(rows) > limit:
+            cursor = (items[-1]['created_at'], items[-1]['id'])
+        return items, cursor
+
+
+_default_history = None
+_default_lock = threading.Lock()
+
+
+def get_history():
+    """Return the process-wide generation history configured from settings"""
+    global _default_history
+    with _default_lock:
+        if _default_history is None:
+            _default_history = GenerationHistory(db.get_db())
+        return _default_history
@@ -0,0 +1,244 @@
+"""Idle-time pool of pre-generated images for popular combinations
+
+Only name and age are personal; what an image shows is decided by hobby,
+color, style, mood and filter plus the age group, the same key the prompt
+cache uses. Every submitted generation bumps its combination's popularity,
+a score that halves every `half_life_hours`.
+
+While no job has run for POOL_IDLE_SECONDS, a warmer thread renders images
+for the top-K combinations until each has `per_combo` ready entries, within
+a rolling 24-hour spend budget. Every paid call is charged to the budget as
+soon as it succeeds, so entries that fail later still count. A visitor who picks one of those
+combinations gets a pooled image at once, with their name added locally as
+a caption. Entries of combinations that drop out of the top-K are evicted.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+
+from . import db
+from . import settings
+from .catalog import translate_user_data
+from .metrics import REGISTRY
+from .prompt_cache import cache_key
+from .state import get_state
+
+logger = logging.getLogger(__name__)
+
+# Popularity below this is forgotten
+MIN_SCORE = 0.05
+
+
+def combo_key(user_data):
+    return cache_key(translate_user_data(user_data))
+
+
+class ImagePool:
+    def __init__(self, db, top_k=10, per_combo=2, budget_usd=0.0, half_life_hours=24):
+        self.db = db
+        self.top_k = top_k
+        self.per_combo = per_combo
+        self.budget_usd = budget_usd
+        self.half_life = half_life_hours * 3600
+
+    def _decayed(self, score, updated_at, now):
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record_pick(self, user_data):
+        """Count a submitted generation towards its combination's popularity"""
+        key = combo_key(user_data)
+        now = time.time()
+        choices = {field: value for field, value in user_data.items() if field != 'name'}
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT score, updated_at FROM combo_popularity WHERE combo_key = ?", (key,)
+            ).fetchone()
+            score = 1.0 + (self._decayed(row[0], row[1], now) if row else 0.0)
+            conn.execute(
+                "INSERT OR REPLACE INTO combo_popularity (combo_key, user_data, score, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(choices, ensure_ascii=False), score, now)
+            )
+
+    def top_combos(self):
+        """Return the top_k (combo_key, user_data, score) by current popularity"""
+        now = time.time()
+        combos = [
+            (row['combo_key'], json.loads(row['user_data']), self._decayed(row['score'], row['updated_at'], now))
+            for row in self.db.query_all("SELECT * FROM combo_popularity")
+        ]
+        combos.sort(key=lambda combo: combo[2], reverse=True)
+        return [combo for combo in combos[:self.top_k] if combo[2] >= MIN_SCORE]
+
+    def ready_counts(self):
+        rows = self.db.query_all(
+            "SELECT combo_key, COUNT(*) FROM image_pool WHERE status = 'ready' GROUP BY combo_key"
+        )
+        return {key: count for key, count in rows}
+
+    def take(self, user_data):
+        """Claim the oldest ready entry for the combination of user_data, or None"""
+        key = combo_key(user_data)
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM image_pool WHERE combo_key = ? AND status = 'ready' "
+                "ORDER BY created_at LIMIT 1",
+                (key,)
+            ).fetchone()
+            if row is None:
+                REGISTRY.inc("weart_image_pool_requests_total", result="miss")
+                return None
+            conn.execute("UPDATE image_pool SET status = 'claimed' WHERE id = ?", (row['id'],))
+        REGISTRY.inc("weart_image_pool_requests_total", result="hit")
+        return dict(row)
+
+    def release(self, entry_id):
+        """Put a claimed entry back, e.g. when the generation was not needed after all"""
+        self.db.execute("UPDATE image_pool SET status = 'ready' WHERE id = ? AND status = 'claimed'", (entry_id,))
+
+    def add(self, key, entry, cost):
+        self.db.execute(
+            "INSERT INTO image_pool (combo_key, english_prompt, image_id, image_url, tier, cost, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, entry['english_prompt'], entry['image_id'], entry.get('image_url'), entry.get('tier'),
+             cost, time.time())
+        )
+
+    def charge(self, cost):
+        """Record USD spent on a paid call for the pool"""
+        self.db.execute("INSERT INTO pool_spend (cost, created_at) VALUES (?, ?)", (cost, time.time()))
+
+    def spent(self, hours=24):
+        """USD charged in the last hours, including calls whose entry never made it into the pool"""
+        return self.db.query_one(
+            "SELECT COALESCE(SUM(cost), 0) FROM pool_spend WHERE created_at > ?",
+            (time.time() - hours * 3600,)
+        )[0]
+
+    def evict(self, keep_keys):
+        """Retire ready entries outside keep_keys and forget stale bookkeeping
+
+        Retired rows and charges are kept for a day.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            ready = conn.execute(
+                "SELECT id, combo_key FROM image_pool WHERE status = 'ready'"
+            ).fetchall()
+            evicted = [entry_id for entry_id, key in ready if key not in keep_keys]
+            conn.executemany("UPDATE image_pool SET status = 'evicted' WHERE id = ?", [(i,) for i in evicted])
+            conn.execute(
+                "DELETE FROM image_pool WHERE status != 'ready' AND created_at < ?", (now - 86400,)
+            )
+            conn.execute("DELETE FROM pool_spend WHERE created_at < ?", (now - 86400,))
+            for key, score, updated_at in conn.execute(
+                "SELECT combo_key, score, updated_at FROM combo_popularity"
+            ).fetchall():
+                if self._decayed(score, updated_at, now) < MIN_SCORE:
+                    conn.execute("DELETE FROM combo_popularity WHERE combo_key = ?", (key,))
+        if evicted:
+            REGISTRY.inc("weart_image_pool_evictions_total", len(evicted))
+        return len(evicted)
+
+    def stats(self):
+        ready, claimed = self.db.query_one(
+            "SELECT COALESCE(SUM(status = 'ready'), 0), COALESCE(SUM(status = 'claimed'), 0) FROM image_pool"
+        )
+        return {"ready": ready, "claimed": claimed, "spent_usd_24h": round(self.spent(), 2)}
+
+
+class PoolWarmer:
+    """Background thread that tops up the pool while the kiosk is idle
+
+    generate(user_data, charge) renders one entry and returns a dict with
+    english_prompt, image_id, image_url and tier, or None. It calls
+    charge(cost) for every paid call as soon as that call succeeds. price()
+    is the current USD cost of one entry, checked against the budget first. With a shared state backend only one
+    process warms at a time.
+    """
+
+    def __init__(self, pool, generate, price, interval=30, idle_seconds=60, state=None):
+        self.pool = pool
+        self.generate = generate
+        self.price = price
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.state = state or get_state()
+        self.worker_id = uuid.uuid4().hex
+
+    def idle(self):
+        """No job is active or has changed within idle_seconds"""
+        busy = self.pool.db.query_one(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') "
+            "OR updated_at > datetime('now', ?)",
+            (f"-{int(self.idle_seconds)} seconds",)
+        )[0]
+        return busy == 0
+
+    def _lease(self):
+        if self.state.get("pool:warmer") not in (None, self.worker_id):
+            return False
+        return self.state.update(
+            "pool:warmer",
+            lambda owner: (owner or self.worker_id, (owner or self.worker_id) == self.worker_id),
+            ttl=3 * self.interval
+        )
+
+    def step(self):
+        """Render at most one entry; True if one was added"""
+        if not self.idle() or not self._lease():
+            return False
+        top = self.pool.top_combos()
+        self.pool.evict({key for key, _, _ in top})
+        ready = self.pool.ready_counts()
+        wanted = [(key, user_data) for key, user_data, _ in top if ready.get(key, 0) < self.pool.per_combo]
+        if not wanted:
+            return False
+        cost = self.price()
+        if self.pool.spent() + cost > self.pool.budget_usd:
+            logger.info("Image pool budget reached, not pre-generating")
+            return False
+
+        key, user_data = wanted[0]
+        entry = self.generate(user_data, self.pool.charge)
+        if entry is None:
+            return False
+        self.pool.add(key, entry, cost)
+        REGISTRY.inc("weart_image_pool_generated_total")
+        logger.info(f"Pre-generated a pool image for {user_data['hobby']} / {user_data['style']}")
+        return True
+
+    def start(self):
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.step()
+                except Exception as e:
+                    logger.error(f"Image pool warmer error: {str(e)}")
+
+        threading.Thread(target=run, name="pool-warmer", daemon=True).start()
+        return self
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_image_pool():
+    """Return the process-wide pool configured from settings, or None if disabled"""
+    global _default_pool
+    if not settings.POOL_USER or settings.POOL_BUDGET_USD_PER_DAY <= 0:
+        return None
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ImagePool(
+                db.get_db(),
+                top_k=settings.POOL_TOP_K,
+                per_combo=settings.POOL_PER_COMBO,
+                budget_usd=settings.POOL_BUDGET_USD_PER_DAY,
+                half_life_hours=settings.POOL_HALF_LIFE_HOURS
+            )
+        return _default_pool
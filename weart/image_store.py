@@ -0,0 +1,176 @@
+"""Content-addressed local store for generated images
+
+The temporary OpenAI image URL is streamed to disk once, named after the
+SHA-256 of its bytes, and converted into smaller renditions:
+
+    <digest>.png        original as delivered
+    <digest>.webp       on-screen display
+    <digest>.jpg        download and QR target
+    <digest>_thumb.webp gallery thumbnail
+
+The UI, QR code and download link are then served from these local files
+instead of re-fetching the multi-megabyte original from the remote CDN.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    "original": ".png",
+    "display": ".webp",
+    "download": ".jpg",
+    "thumb": "_thumb.webp",
+}
+
+
+class ImageStore:
+    def __init__(self, root, thumb_width=384, webp_quality=82, jpeg_quality=90, chunk_size=64 * 1024):
+        self.root = root
+        self.thumb_width = thumb_width
+        self.webp_quality = webp_quality
+        self.jpeg_quality = jpeg_quality
+        self.chunk_size = chunk_size
+        os.makedirs(self.root, exist_ok=True)
+
+    def filename(self, digest, rendition):
+        return f"{digest}{RENDITIONS[rendition]}"
+
+    def path(self, digest, rendition):
+        return os.path.join(self.root, self.filename(digest, rendition))
+
+    def exists(self, digest, rendition="display"):
+        return os.path.exists(self.path(digest, rendition))
+
+    def ingest(self, url, timeout=60):
+        """Download url once and build its renditions, returning the content digest"""
+        import requests
+
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                with requests.get(url, stream=True, timeout=timeout) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        sha.update(chunk)
+                        out.write(chunk)
+            digest = sha.hexdigest()
+            original = self.path(digest, "original")
+            if os.path.exists(original):
+                os.remove(tmp_path)
+            else:
+                # mkstemp creates the file private; renditions are meant to be served
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, original)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if not self.exists(digest, "thumb"):
+            self._render(digest)
+        return digest
+
+    def caption(self, digest, text):
+        """Store a copy of an image with text on a band along its bottom edge
+
+        Returns the digest of the copy. The same image and text always give
+        the same copy, so repeating a caption costs nothing.
+        """
+        from PIL import Image, ImageDraw
+
+        with Image.open(self.path(digest, "original")) as image:
+            image = image.convert("RGB")
+        draw = ImageDraw.Draw(image, "RGBA")
+        font = _caption_font(max(16, image.height // 16))
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        band = (bottom - top) * 2
+        draw.rectangle((0, image.height - band, image.width, image.height), fill=(0, 0, 0, 140))
+        draw.text(
+            ((image.width - (right - left)) / 2 - left, image.height - band + (band - (bottom - top)) / 2 - top),
+            text, font=font, fill=(255, 255, 255)
+        )
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+        captioned = hashlib.sha256(data).hexdigest()
+        if not self.exists(captioned, "original"):
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path(captioned, "original"))
+        if not self.exists(captioned, "thumb"):
+            self._render(captioned)
+        return captioned
+
+    def _render(self, digest):
+        from PIL import Image
+
+        with Image.open(self.path(digest, "original")) as image:
+            image = image.convert("RGB")
+            self._save_atomic(image, self.path(digest, "display"), "WEBP", quality=self.webp_quality, method=4)
+            self._save_atomic(image, self.path(digest, "download"), "JPEG", quality=self.jpeg_quality,
+                              optimize=True, progressive=True)
+            thumb_height = round(image.height * self.thumb_width / image.width)
+            thumb = image.resize((self.thumb_width, thumb_height), Image.LANCZOS)
+            self._save_atomic(thumb, self.path(digest, "thumb"), "WEBP", quality=self.webp_quality)
+
+    @staticmethod
+    def _save_atomic(image, path, fmt, **options):
+        # Write next to the target and rename so readers never see half a file.
+        # Jobs sharing a coalesced image may render the same digest concurrently,
+        # so each writer gets its own temporary name.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                image.save(out, format=fmt, **options)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _caption_font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(settings.CAPTION_FONT, size)
+    except OSError:
+        logger.warning(f"Caption font {settings.CAPTION_FONT} not found, using the default font")
+        return ImageFont.load_default()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_image_store():
+    """Return the process-wide image store configured from settings"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ImageStore(settings.IMAGE_STORE_DIR)
+        return _default_store
+
+
+def static_url(digest, rendition):
+    """Relative URL under which Streamlit's static serving exposes a rendition"""
+    return f"{settings.IMAGE_STATIC_PATH}/{get_image_store().filename(digest, rendition)}"
+
+
+def public_url(digest, rendition="download"):
+    """Absolute URL of a rendition for QR codes, or None without PUBLIC_BASE_URL"""
+    if not settings.PUBLIC_BASE_URL:
+        return None
+    return f"{settings.PUBLIC_BASE_URL}/{static_url(digest, rendition)}"
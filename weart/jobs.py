@@ -0,0 +1,238 @@
+"""Background generation jobs
+
+Generations run on a small worker thread pool instead of the Streamlit
+script thread, and every job is stored in the `jobs` table of users.db.
+A rerun or a reconnected browser simply reattaches to the job, and jobs
+that were queued or running when the process stopped are picked up again
+on the next start, skipping the stages they had already finished.
+
+Job progress notifications and live fields go through the state backend.
+With a shared backend a browser may poll any process for a job, and every
+process heartbeats so the others can take over its jobs if it stops.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import REGISTRY
+from .state import LocalState
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+# How long a job's version counter and live fields outlive their last update
+JOB_STATE_TTL = 3600
+
+
+class JobQueue:
+    """SQLite-backed job table plus the worker pool that executes it
+
+    runner(job, checkpoint, publish) performs the work for a job dict and
+    returns the final result dict. It may call checkpoint(stage, result) at any
+    point to store partial progress; the stored result is handed back to the
+    runner when an interrupted job is resumed. publish(**fields) shares
+    short-lived progress, such as a prompt being streamed, with waiting
+    readers through live() without touching the database.
+
+    on_done(job, result, checkpoint), if given, is called once a job is marked
+    done, for follow-up work that should not hold the job open.
+    """
+
+    def __init__(self, runner, db, max_workers=4, on_done=None, state=None):
+        self.runner = runner
+        self.on_done = on_done
+        self.db = db
+        self.state = state or LocalState()
+        self.worker_id = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._changed = threading.Condition()
+        self._local_changes = 0
+        # Changes made by other processes are only seen by polling the backend
+        self._poll_interval = 0.25 if self.state.shared else None
+
+    def _notify(self, job_id):
+        self.state.incr(f"job:{job_id}:version", ttl=JOB_STATE_TTL)
+        with self._changed:
+            self._local_changes += 1
+            self._changed.notify_all()
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.db.execute(
+            f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (*fields.values(), job_id)
+        )
+        self._notify(job_id)
+
+    def publish(self, job_id, **fields):
+        """Update the live state of a running job and wake its readers"""
+        self.state.update(
+            f"job:{job_id}:live", lambda live: (dict(live or {}, **fields), None), ttl=JOB_STATE_TTL
+        )
+        self._notify(job_id)
+
+    def live(self, job_id):
+        return dict(self.state.get(f"job:{job_id}:live") or {})
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['user_data'] = json.loads(job['user_data'])
+        job['result'] = json.loads(job['result']) if job['result'] else {}
+        return job
+
+    def _fetch_one(self, query, params):
+        return self._row_to_job(self.db.query_one(query, params))
+
+    def submit(self, username, user_data, dedupe_key=None, result=None, session_id=None):
+        """Store a new job and hand it to the worker pool, returning its id
+
+        With a dedupe_key, a queued or running job of the same user with the
+        same key is returned instead of creating a duplicate. The second value
+        tells whether an existing job was reused. A partial result, e.g. a
+        prompt computed ahead of time, is handed to the runner like a resumed job.
+        """
+        job_id = uuid.uuid4().hex
+        with self.db.transaction() as conn:
+            if dedupe_key:
+                existing = conn.execute(
+                    "SELECT id FROM jobs WHERE username = ? AND dedupe_key = ? AND status IN (?, ?)",
+                    (username, dedupe_key, *ACTIVE_STATUSES)
+                ).fetchone()
+                if existing:
+                    return existing[0], True
+            conn.execute(
+                "INSERT INTO jobs (id, username, user_data, dedupe_key, result, session_id, worker) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, username, json.dumps(user_data, ensure_ascii=False), dedupe_key,
+                    json.dumps(result, ensure_ascii=False) if result else None, session_id,
+                    self.worker_id
+                )
+            )
+        self._executor.submit(self._run, job_id, time.perf_counter())
+        return job_id, False
+
+    def get(self, job_id):
+        return self._fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+    def latest_active(self, username):
+        """Return the newest queued or running job of a user, if any"""
+        return self._fetch_one(
+            "SELECT * FROM jobs WHERE username = ? AND status IN (?, ?) "
+            "ORDER BY created_at DESC LIMIT 1",
+            (username, *ACTIVE_STATUSES)
+        )
+
+    def version(self, job_id):
+        return self.state.get(f"job:{job_id}:version", 0)
+
+    def wait(self, job_id, seen_version, timeout=1.0):
+        """Block until the job changes after seen_version or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._changed:
+                changes = self._local_changes
+            version = self.version(job_id)
+            remaining = deadline - time.monotonic()
+            if version != seen_version or remaining <= 0:
+                return version
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._local_changes != changes,
+                    min(remaining, self._poll_interval or remaining)
+                )
+
+    def _alive(self, worker):
+        return worker == self.worker_id or (
+            worker is not None and self.state.get(f"worker:{worker}") is not None
+        )
+
+    def resume_pending(self):
+        """Re-enqueue unfinished jobs whose process is gone
+
+        With a local state backend these are the jobs left queued or running
+        by a previous process; with a shared one also those of processes that
+        stopped heartbeating. Each job is claimed first, so only one process
+        resumes it.
+        """
+        rows = self.db.query_all(
+            "SELECT id, worker FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            ACTIVE_STATUSES
+        )
+        resumed = 0
+        for job_id, worker in rows:
+            if self._alive(worker):
+                continue
+            claimed = self.db.execute(
+                "UPDATE jobs SET worker = ? WHERE id = ? AND worker IS ?",
+                (self.worker_id, job_id, worker)
+            ).rowcount
+            if not claimed:
+                continue
+            logger.info(f"Resuming generation job {job_id}")
+            self._executor.submit(self._run, job_id, None)
+            resumed += 1
+        return resumed
+
+    def start_heartbeat(self, interval):
+        """Announce this process to the others and take over the jobs of dead ones"""
+        def beat():
+            self.state.set(f"worker:{self.worker_id}", time.time(), ttl=3 * interval)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    beat()
+                    self.resume_pending()
+                except Exception as e:
+                    logger.error(f"Job queue heartbeat error: {str(e)}")
+
+        beat()
+        threading.Thread(target=run, name="job-heartbeat", daemon=True).start()
+
+    def _run(self, job_id, submitted_at):
+        if submitted_at is not None:
+            REGISTRY.observe("weart_job_queue_wait_seconds", time.perf_counter() - submitted_at)
+        job = self.get(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return
+        self._update(job_id, status='running')
+
+        def checkpoint(stage, result):
+            self._update(job_id, stage=stage, result=json.dumps(result, ensure_ascii=False))
+
+        def publish(**fields):
+            self.publish(job_id, **fields)
+
+        try:
+            result = self.runner(job, checkpoint, publish)
+        except Exception as e:
+            logger.error(f"Error in generation job {job_id}: {str(e)}")
+            self._update(job_id, status='failed', error=str(e))
+            REGISTRY.inc("weart_jobs_total", status='failed')
+            return
+        finally:
+            # Anything published is in the checkpointed result by now
+            self.state.delete(f"job:{job_id}:live")
+
+        if result.get('failed_stage'):
+            self._update(
+                job_id, status='failed', error=result['failed_stage'],
+                result=json.dumps(result, ensure_ascii=False)
+            )
+            REGISTRY.inc("weart_jobs_total", status='failed')
+        else:
+            self._update(job_id, status='done', result=json.dumps(result, ensure_ascii=False))
+            REGISTRY.inc("weart_jobs_total", status='done')
+            if self.on_done:
+                try:
+                    self.on_done(job, result, checkpoint)
+                except Exception as e:
+                    logger.error(f"Error after generation job {job_id}: {str(e)}")
@@ -0,0 +1,229 @@
+"""Latency histograms and counters with a Prometheus text endpoint
+
+Recording is a perf_counter call, a bisect and a short lock per observation,
+so spans can wrap hot paths such as individual DB queries. Everything lives
+in the process-wide REGISTRY and is exposed by start_metrics_server() and on
+the admin page.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        counts, _, count = self.snapshot()
+        if not count:
+            return None
+        target = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= target and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = [*label_key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text="", **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help_text)
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collect):
+        """Register collect() -> [(name, labels, value)] for gauges read at scrape time"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block into the span histogram"""
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.observe("weart_span_duration_seconds", time.perf_counter() - started,
+                         span=name, outcome=outcome, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of span()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _gauges(self):
+        gauges = []
+        for collect in list(self._collectors):
+            try:
+                gauges.extend(collect())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+        return gauges
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        described = set()
+        for (name, label_key), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip([*histogram.buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(label_key, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_key)} {total}")
+            lines.append(f"{name}_count{_format_labels(label_key)} {count}")
+
+        for (name, label_key), value in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(label_key)} {value}")
+
+        for name, labels, value in self._gauges():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Rows for the admin page: one per histogram with count, mean and quantiles"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        rows = []
+        for (name, label_key), histogram in histograms:
+            _, total, count = histogram.snapshot()
+            if not count:
+                continue
+            rows.append({
+                "metric": name,
+                "labels": ", ".join(f"{k}={v}" for k, v in label_key),
+                "count": count,
+                "mean_s": round(total / count, 4),
+                "p50_s": round(histogram.quantile(0.5), 4),
+                "p95_s": round(histogram.quantile(0.95), 4),
+                "p99_s": round(histogram.quantile(0.99), 4),
+            })
+        return rows
+
+    def counters(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+        rows = [
+            {"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in label_key), "value": value}
+            for (name, label_key), value in counters
+        ]
+        for name, labels, value in self._gauges():
+            rows.append({"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in sorted(labels.items())), "value": value})
+        return rows
+
+
+REGISTRY = MetricsRegistry()
+span = REGISTRY.span
+timed = REGISTRY.timed
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics on a background thread; returns None if the port is taken"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Metrics endpoint not started on {host}:{port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,98 @@
+"""Speculative prompt expansion for the input form
+
+Every rerun of the input page reports the current form values. Once they
+have stayed the same for the debounce window, the prompt expansion starts
+in the background; a change of input cancels the pending timer and discards
+any result computed for the old values. When the user presses generate the
+prompt is usually ready already.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _Prefetch:
+    def __init__(self, key):
+        self.key = key
+        self.timer = None
+        self.future = None
+        self.created = time.monotonic()
+
+
+class PromptPrefetcher:
+    """Debounced background prompt expansion, one pending expansion per session
+
+    The scheduled callable returns (english_prompt, georgian_summary).
+    """
+
+    def __init__(self, debounce=1.5, max_workers=2, ttl=600):
+        self.debounce = debounce
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, session_id, key, expand):
+        """Note the current form values; expansion starts once they stay unchanged"""
+        with self._lock:
+            self._sweep()
+            current = self._pending.get(session_id)
+            if current is not None and current.key == key:
+                return
+            if current is not None:
+                self._cancel(current)
+            entry = self._pending[session_id] = _Prefetch(key)
+            entry.timer = threading.Timer(self.debounce, self._start, (session_id, entry, expand))
+            entry.timer.daemon = True
+            entry.timer.start()
+
+    def _start(self, session_id, entry, expand):
+        with self._lock:
+            if self._pending.get(session_id) is not entry:
+                return
+            entry.future = self._executor.submit(expand)
+
+    @staticmethod
+    def _cancel(entry):
+        entry.timer.cancel()
+        if entry.future is not None:
+            # A request already on the wire cannot be stopped; its result is dropped
+            entry.future.cancel()
+
+    def _sweep(self):
+        now = time.monotonic()
+        for session_id, entry in list(self._pending.items()):
+            if now - entry.created > self.ttl:
+                self._cancel(entry)
+                del self._pending[session_id]
+
+    def take(self, session_id, key):
+        """Return the finished prompt for key, or None if it is not ready
+
+        The pending entry is removed either way.
+        """
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is None:
+            return None
+        if entry.key != key or entry.future is None or not entry.future.done():
+            self._cancel(entry)
+            return None
+        try:
+            english_prompt, georgian_summary = entry.future.result()
+        except Exception as e:
+            logger.error(f"Prompt prefetch failed: {str(e)}")
+            return None
+        if not english_prompt:
+            return None
+        return english_prompt, georgian_summary
+
+    def discard(self, session_id):
+        """Drop the session's pending expansion, e.g. on logout"""
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is not None:
+            self._cancel(entry)
@@ -0,0 +1,129 @@
+"""Persistent cache of GPT-4 prompt expansions
+
+Apart from name and age the prompt request is built from a small closed set
+of choices, so expansions are cached per combination of the translated
+hobby, color, style, mood and filter plus a coarse age group. Prompts are
+requested with [NAME] and [AGE] placeholders, which are filled in after
+lookup. Each combination collects up to `variants` different prompts before
+cached ones are reused, so repeat visitors still see some variety.
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+
+from . import db
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+NAME_PLACEHOLDER = "[NAME]"
+AGE_PLACEHOLDER = "[AGE]"
+
+KEY_FIELDS = ('hobby', 'color', 'style', 'mood', 'filter')
+
+
+def age_group(age):
+    """Bucket an age so prompts stay age-appropriate without keying on exact ages"""
+    age = int(age)
+    if age < 13:
+        return "child"
+    if age < 20:
+        return "teenager"
+    if age < 60:
+        return "adult"
+    return "senior"
+
+
+def cache_key(eng_data):
+    """Build the cache key from the normalized output of translate_user_data"""
+    normalized = {field: str(eng_data[field]).strip().lower() for field in KEY_FIELDS}
+    normalized['age_group'] = age_group(eng_data['age'])
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def fill_placeholders(template, name, age):
+    return template.replace(NAME_PLACEHOLDER, str(name)).replace(AGE_PLACEHOLDER, str(age))
+
+
+class PromptCache:
+    """SQLite-backed prompt cache with TTL expiry and LRU eviction"""
+
+    def __init__(self, db, ttl_hours=168, max_entries=2000, variants=3):
+        self.db = db
+        self.ttl_hours = ttl_hours
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+
+    def get(self, key):
+        """Return a cached template, or None while the key still collects variants"""
+        with self.db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM prompt_cache WHERE cache_key = ? AND created_at < datetime('now', ?)",
+                (key, f"-{self.ttl_hours} hours")
+            )
+            rows = conn.execute(
+                "SELECT variant, template FROM prompt_cache WHERE cache_key = ?",
+                (key,)
+            ).fetchall()
+            if len(rows) < self.variants:
+                return None
+            variant, template = random.choice(rows)
+            conn.execute(
+                "UPDATE prompt_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP "
+                "WHERE cache_key = ? AND variant = ?",
+                (key, variant)
+            )
+            return template
+
+    def put(self, key, template):
+        """Store a new variant for key and evict the least recently used overflow
+
+        The template takes the lowest free variant slot, so slots freed by
+        expiry or eviction are refilled; only when all are taken does it
+        replace the oldest variant.
+        """
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT variant FROM prompt_cache WHERE cache_key = ? ORDER BY created_at, rowid",
+                (key,)
+            ).fetchall()
+            used = {row[0] for row in rows}
+            free = [variant for variant in range(self.variants) if variant not in used]
+            variant = free[0] if free else rows[0][0]
+            conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (cache_key, variant, template) VALUES (?, ?, ?)",
+                (key, variant, template)
+            )
+            conn.execute(
+                "DELETE FROM prompt_cache WHERE rowid IN ("
+                "SELECT rowid FROM prompt_cache ORDER BY last_used_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        entries, keys, hits = self.db.query_one(
+            "SELECT COUNT(*), COUNT(DISTINCT cache_key), COALESCE(SUM(hits), 0) FROM prompt_cache"
+        )
+        return {"entries": entries, "keys": keys, "hits": hits}
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """Return the process-wide cache configured from settings, or None if disabled"""
+    global _default_cache
+    if not settings.PROMPT_CACHE_ENABLED:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PromptCache(
+                db.get_db(),
+                ttl_hours=settings.PROMPT_CACHE_TTL_HOURS,
+                max_entries=settings.PROMPT_CACHE_MAX_ENTRIES,
+                variants=settings.PROMPT_CACHE_VARIANTS
+            )
+        return _default_cache
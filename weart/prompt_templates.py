@@ -0,0 +1,146 @@
+"""Offline prompt engine
+
+Composes the DALL-E prompt locally from the English values returned by
+translate_user_data, using curated phrase fragments per hobby, style, mood,
+color and filter. Used instead of the GPT-4 expansion in "template" mode and
+as the fallback in "auto" mode.
+"""
+import random
+
+HOBBY_SCENES = {
+    "football": [
+        "scoring a spectacular bicycle-kick goal in a packed stadium under floodlights",
+        "dribbling past defenders on a sunlit neighborhood pitch with cheering friends",
+    ],
+    "basketball": [
+        "soaring toward the hoop for a slam dunk in a glowing indoor arena",
+        "sinking a buzzer-beater shot on an outdoor city court at sunset",
+    ],
+    "chess": [
+        "contemplating a decisive move over a giant ornate chessboard",
+        "playing chess in a grand library where the pieces come alive",
+    ],
+    "swimming": [
+        "gliding through crystal-clear water with light rippling across the pool floor",
+        "diving into a turquoise lagoon surrounded by coral and tropical fish",
+    ],
+    "yoga": [
+        "holding a graceful tree pose on a cliff above a misty valley at sunrise",
+        "meditating on a wooden deck by a still lake surrounded by blossoms",
+    ],
+    "tennis": [
+        "hitting a powerful forehand on a clay court with dust flying",
+        "serving on a lush grass court framed by a cheering crowd",
+    ],
+    "running": [
+        "crossing a marathon finish line with arms raised in triumph",
+        "running along a winding coastal trail with the wind in their hair",
+    ],
+    "painting": [
+        "painting a vibrant canvas in a sunlit studio full of brushes and color",
+        "standing at an easel on a hilltop, painting the landscape below",
+    ],
+    "music": [
+        "performing on a glowing stage with musical notes swirling through the air",
+        "playing an instrument in a cozy room filled with vinyl records and warm light",
+    ],
+    "dancing": [
+        "dancing mid-leap on a grand stage under a sweeping spotlight",
+        "dancing through a lantern-lit street festival with flowing fabric around them",
+    ],
+    "photography": [
+        "framing the perfect shot with a vintage camera on a mountain overlook",
+        "capturing city lights at night from a rooftop with a camera on a tripod",
+    ],
+    "ceramics": [
+        "shaping a vase on a spinning pottery wheel in a rustic workshop",
+        "glazing handmade bowls surrounded by shelves of colorful ceramics",
+    ],
+    "embroidery": [
+        "stitching an intricate floral pattern by a sunny window",
+        "surrounded by spools of silk thread and a half-finished tapestry",
+    ],
+    "programming": [
+        "coding at a sleek workstation surrounded by floating holographic code",
+        "building an app in a cozy night-time workspace lit by multiple screens",
+    ],
+    "gaming": [
+        "stepping into a vivid video game world with a controller in hand",
+        "competing in an esports arena with neon lights and roaring fans",
+    ],
+    "robotics": [
+        "assembling a friendly robot in a high-tech workshop",
+        "leading a team of small robots through a futuristic laboratory",
+    ],
+    "3D modeling": [
+        "sculpting a glowing 3D model that rises out of the screen",
+        "surrounded by floating wireframe shapes in a digital studio",
+    ],
+    "artificial intelligence": [
+        "collaborating with a luminous AI companion made of light and data",
+        "standing before a vast neural network visualized as a galaxy of connections",
+    ],
+    "gardening": [
+        "tending a blooming garden full of flowers, vegetables and butterflies",
+        "planting seedlings in a sunlit greenhouse overflowing with greenery",
+    ],
+    "hiking": [
+        "hiking along a ridge with a breathtaking mountain panorama behind them",
+        "walking a forest trail dappled with golden light",
+    ],
+    "camping": [
+        "sitting by a crackling campfire under a sky full of stars",
+        "setting up a tent beside a mountain lake at dusk",
+    ],
+    "mountain climbing": [
+        "reaching a snowy summit with flags fluttering in the wind",
+        "climbing a dramatic rock face high above the clouds",
+    ],
+}
+
+STYLE_PHRASES = {
+    "realistic": "photorealistic rendering with lifelike textures and natural proportions",
+    "fantastic": "fantasy art with magical elements, glowing particles and a dreamlike world",
+    "cartoon": "playful cartoon illustration with bold outlines and expressive characters",
+    "anime": "anime art style with clean linework, expressive eyes and dynamic composition",
+    "impressionistic": "impressionist painting with visible brushstrokes and shimmering light",
+}
+
+MOOD_PHRASES = {
+    "cheerful": "a joyful, uplifting atmosphere with warm smiles and bright light",
+    "peaceful": "a calm, serene atmosphere with soft light and gentle harmony",
+    "energetic": "a dynamic, high-energy atmosphere full of motion and excitement",
+    "romantic": "a dreamy, tender atmosphere with a soft golden glow",
+    "adventurous": "a bold, adventurous atmosphere with a sense of discovery",
+    "nostalgic": "a wistful, nostalgic atmosphere with a warm, timeless feel",
+}
+
+FILTER_PHRASES = {
+    "natural": "natural color grading",
+    "retro": "retro film look with subtle grain and faded tones",
+    "dramatic": "dramatic chiaroscuro lighting and deep shadows",
+    "bright": "bright, airy high-key lighting",
+    "high contrast": "high-contrast lighting with punchy colors",
+}
+
+COMPOSITIONS = [
+    "cinematic wide shot, rule-of-thirds composition",
+    "dynamic low-angle shot with a sense of scale",
+    "centered hero composition with a softly blurred background",
+]
+
+
+def build_template_prompt(eng_data, rng=random):
+    """Compose a DALL-E prompt from the translated user choices without any network call"""
+    scenes = HOBBY_SCENES.get(eng_data['hobby'], [f"enjoying {eng_data['hobby']}"])
+    color = eng_data['color']
+    return (
+        f"A personalized portrait of {eng_data['name']}, a {eng_data['age']}-year-old "
+        f"who loves {eng_data['hobby']}, {rng.choice(scenes)}. "
+        f"Rendered as {STYLE_PHRASES.get(eng_data['style'], eng_data['style'])}. "
+        f"{MOOD_PHRASES.get(eng_data['mood'], eng_data['mood']).capitalize()}. "
+        f"The palette is dominated by {color}, with {color} accents in clothing and scenery. "
+        f"{FILTER_PHRASES.get(eng_data['filter'], eng_data['filter']).capitalize()}, "
+        f"{rng.choice(COMPOSITIONS)}, highly detailed. "
+        f"Family-friendly and appropriate for all ages, no text in the image."
+    )
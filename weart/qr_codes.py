@@ -0,0 +1,69 @@
+"""QR code rendering with an in-process LRU cache
+
+The result page re-renders on every rerun, so QR output is cached on the URL
+and render parameters. SVG output is built straight from the module matrix
+as a single stroked path, skipping PIL entirely; PNG output is kept for
+callers that need a raster.
+"""
+from functools import lru_cache
+from io import BytesIO
+
+from . import settings
+
+
+def _make_matrix(url, border):
+    import qrcode
+
+    # No fixed version: fit=True picks the smallest version that holds the URL
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def _matrix_to_svg(matrix):
+    """Encode the module matrix as one SVG path, stroking each row's dark runs"""
+    size = len(matrix)
+    commands = []
+    for y, row in enumerate(matrix):
+        pen = 0
+        x = 0
+        row_commands = []
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            # Relative moves keep every number short
+            row_commands.append(f"m{start - pen} 0h{x - start}")
+            pen = x
+        if row_commands:
+            commands.append(f"M0 {y}.5" + "".join(row_commands))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(commands)}" stroke="#000"/></svg>'
+    )
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def render_qr(url, fmt="svg", box_size=10, border=4):
+    """Render url as a QR code: SVG markup (str) or PNG bytes"""
+    qr = _make_matrix(url, border)
+    if fmt == "svg":
+        return _matrix_to_svg(qr.get_matrix())
+    qr.box_size = box_size
+    buffered = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def cache_stats():
+    info = render_qr.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
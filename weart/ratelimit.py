@@ -0,0 +1,292 @@
+"""Per-API-key request governor for the OpenAI endpoints
+
+Every chat and image call made with a key passes through that key's
+governor, which
+
+* queues callers fairly: sessions sharing a key take turns, so one busy
+  kiosk cannot starve the others,
+* caps the number of calls in flight,
+* spaces calls with a token bucket per endpoint; callers wait for their
+  token before queueing for a slot, so sessions held back by one endpoint's
+  rate never occupy slots that another endpoint's calls could use, and
+* retries throttled or failed calls with jittered exponential backoff,
+  honoring Retry-After. A 429 also pauses the endpoint's bucket, so every
+  session on the key backs off together instead of piling on.
+
+A call may also carry a circuit breaker (see breaker.py). It is checked
+before the call queues for the key and before every retry, and told how
+each attempt went.
+
+The buckets live in the state backend, so with a shared backend all
+processes using a key draw from one bucket. Fair queueing and the
+concurrency cap stay per process.
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+
+from . import settings
+from .breaker import CircuitOpen
+from .clients import get_client_registry
+from .metrics import REGISTRY
+from .state import LocalState, get_state
+
+logger = logging.getLogger(__name__)
+
+# Identifies the session on whose behalf a call is made, for fair queueing
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised locally when a call could not be sent before its deadline"""
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting callers
+
+    Its (tokens, updated, paused_until) triple is stored under key in a state
+    backend. Times are wall clock, so processes sharing the backend agree.
+    """
+
+    def __init__(self, rate_per_minute, burst=None, state=None, key="bucket"):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, rate_per_minute / 6.0)
+        self.state = state or LocalState()
+        self.key = key
+
+    def _refill(self, bucket, now):
+        tokens, updated, paused_until = bucket or (self.capacity, now, 0.0)
+        return min(self.capacity, tokens + (now - updated) * self.rate), paused_until
+
+    def reserve(self):
+        """Take a token and return how long the caller has to wait before using it"""
+        def take(bucket):
+            now = time.time()
+            tokens, paused_until = self._refill(bucket, now)
+            tokens -= 1
+            wait = -tokens / self.rate if tokens < 0 else 0.0
+            return [tokens, now, paused_until], max(wait, paused_until - now)
+
+        return self.state.update(self.key, take)
+
+    def refund(self):
+        """Return a reserved token that will not be used"""
+        def give_back(bucket):
+            now = time.time()
+            tokens, paused_until = self._refill(bucket, now)
+            return [min(self.capacity, tokens + 1), now, paused_until], None
+
+        self.state.update(self.key, give_back)
+
+    def pause(self, seconds):
+        """Hold back every caller for seconds, e.g. after the provider returned 429"""
+        def hold(bucket):
+            now = time.time()
+            tokens, paused_until = self._refill(bucket, now)
+            return [tokens, now, max(paused_until, now + seconds)], None
+
+        self.state.update(self.key, hold)
+
+
+class FairGate:
+    """Concurrency cap whose waiting callers are served round-robin per session"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+
+    def _is_next(self, ticket):
+        if self.active >= self.limit or not self._queues:
+            return False
+        return next(iter(self._queues.values()))[0] is ticket
+
+    def acquire(self, session_id):
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._cond.wait_for(lambda: self._is_next(ticket))
+            waiting = self._queues[session_id]
+            waiting.popleft()
+            if waiting:
+                # Served sessions go to the back of the line
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self.active += 1
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def waiting(self):
+        with self._cond:
+            return sum(len(waiting) for waiting in self._queues.values())
+
+
+def _retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _is_retryable(error):
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _is_rate_limited(error):
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+def _is_upstream_failure(error):
+    """Errors that say the upstream is unhealthy, as opposed to this key or request
+
+    Connection errors and timeouts of sent requests (APITimeoutError is an
+    APIConnectionError) and 5xx responses count; 429s and DeadlineExceeded,
+    raised here when a call ran out of time before or while it was sent, do not.
+    """
+    return _is_retryable(error) and not _is_rate_limited(error)
+
+
+@contextmanager
+def _observed(breaker):
+    """Report the outcome and duration of the enclosed call to breaker"""
+    if breaker is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        if _is_upstream_failure(e):
+            breaker.failure()
+        else:
+            breaker.ignore()
+        raise
+    breaker.success(time.monotonic() - started)
+
+
+class KeyGovernor:
+    def __init__(self, rates, max_concurrent, max_attempts=4, base_delay=1.0, max_delay=30.0,
+                 state=None, name="key", lease=None):
+        self.buckets = {
+            endpoint: TokenBucket(rate, state=state, key=f"ratelimit:{name}:{endpoint}")
+            for endpoint, rate in rates.items()
+        }
+        self.gate = FairGate(max_concurrent)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # lease() returns a context manager held around every call, e.g. to keep the client open
+        self.lease = lease or nullcontext
+
+    def take_token(self, endpoint, deadline=None):
+        """Wait for the endpoint's next token; DeadlineExceeded if it comes too late"""
+        bucket = self.buckets[endpoint]
+        wait = bucket.reserve()
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            bucket.refund()
+            raise DeadlineExceeded(f"No {endpoint} token before the deadline")
+        if wait > 0:
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the key's concurrent call slots"""
+        self.gate.acquire(current_session.get())
+        try:
+            yield
+        finally:
+            self.gate.release()
+
+    def call(self, endpoint, fn, max_attempts=None, deadline=None, breaker=None):
+        """Run fn under the governor, retrying throttled and transient failures
+
+        With a deadline (a time.monotonic() value) no retry is started that
+        could not begin before it. While breaker is open, CircuitOpen is
+        raised instead of calling fn.
+        """
+        with self.lease():
+            return self._call(endpoint, fn, max_attempts, deadline, breaker)
+
+    def _call(self, endpoint, fn, max_attempts, deadline, breaker):
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpen(f"Circuit {breaker.name} is open")
+            try:
+                self.take_token(endpoint, deadline)
+            except DeadlineExceeded:
+                if breaker is not None:
+                    breaker.ignore()
+                raise
+            try:
+                with self.slot(), REGISTRY.span("openai", endpoint=endpoint), _observed(breaker):
+                    return fn()
+            except Exception as e:
+                if attempt + 1 >= attempts or not _is_retryable(e):
+                    raise
+                REGISTRY.inc("weart_openai_retries_total", endpoint=endpoint, error=type(e).__name__)
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                if _is_rate_limited(e):
+                    self.buckets[endpoint].pause(delay)
+                logger.warning(
+                    f"{endpoint} call failed ({type(e).__name__}), "
+                    f"retry {attempt + 1}/{attempts - 1} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(api_key):
+    """Return the governor shared by every caller using api_key"""
+    key_id = hashlib.sha256(api_key.encode()).hexdigest()
+    with _governors_lock:
+        governor = _governors.get(key_id)
+        if governor is None:
+            governor = _governors[key_id] = KeyGovernor(
+                {
+                    "chat": settings.RATE_LIMIT_CHAT_PER_MINUTE,
+                    "images": settings.RATE_LIMIT_IMAGES_PER_MINUTE,
+                },
+                settings.MAX_CONCURRENT_CALLS_PER_KEY,
+                max_attempts=settings.RETRY_MAX_ATTEMPTS,
+                base_delay=settings.RETRY_BASE_DELAY,
+                max_delay=settings.RETRY_MAX_DELAY,
+                state=get_state(),
+                name=key_id[:16],
+                lease=lambda: get_client_registry().lease(api_key)
+            )
+        return governor
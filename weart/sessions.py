@@ -0,0 +1,129 @@
+"""Server-side login sessions
+
+Logging in stores a random token in the `sessions` table of users.db and
+only that token goes into the browser cookie; the API key never leaves the
+server. Tokens are kept as SHA-256 hashes, so a leaked database cannot be
+replayed as cookies.
+
+Restoring a session on page load is one cookie read plus a lookup in an
+in-memory LRU of active sessions, which holds the username and API key until
+the session expires. Expired rows are swept from the table at most once per
+`sweep_seconds`. With a shared state backend a logout bumps a revocation
+epoch there, and every process drops its cache when it sees a new epoch.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from . import db
+from . import settings
+from .metrics import REGISTRY
+from .state import LocalState, get_state
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore:
+    def __init__(self, db, ttl_seconds=30 * 86400, cache_size=1024, sweep_seconds=3600, state=None):
+        self.db = db
+        self.state = state or LocalState()
+        self._epoch = 0
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self.sweep_seconds = sweep_seconds
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def create(self, username):
+        """Start a session for username and return its token and expiry time"""
+        self.sweep()
+        token = secrets.token_urlsafe(32)
+        expires_at = time.time() + self.ttl_seconds
+        self.db.execute(
+            "INSERT INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)",
+            (hash_token(token), username, expires_at)
+        )
+        return token, expires_at
+
+    def resolve(self, token):
+        """Return (username, api_key) for a live session token, otherwise None"""
+        if not token:
+            return None
+        token_hash = hash_token(token)
+        now = time.time()
+        epoch = self.state.get("sessions:epoch", 0) if self.state.shared else 0
+        with self._lock:
+            if epoch != self._epoch:
+                # Another process revoked a session that may be cached here
+                self._cache.clear()
+                self._epoch = epoch
+            entry = self._cache.get(token_hash)
+            if entry is not None:
+                if entry[2] > now:
+                    self._cache.move_to_end(token_hash)
+                    REGISTRY.inc("weart_session_lookups_total", source="cache")
+                    return entry[0], entry[1]
+                del self._cache[token_hash]
+
+        row = self.db.query_one(
+            "SELECT s.username, u.api_key, s.expires_at FROM sessions s "
+            "JOIN users u ON u.username = s.username "
+            "WHERE s.token_hash = ? AND s.expires_at > ?",
+            (token_hash, now)
+        )
+        if row is None:
+            REGISTRY.inc("weart_session_lookups_total", source="missing")
+            return None
+        REGISTRY.inc("weart_session_lookups_total", source="db")
+        with self._lock:
+            self._cache[token_hash] = tuple(row)
+            self._cache.move_to_end(token_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return row[0], row[1]
+
+    def revoke(self, token):
+        """End a session, e.g. on logout"""
+        if not token:
+            return
+        token_hash = hash_token(token)
+        with self._lock:
+            self._cache.pop(token_hash, None)
+        self.db.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash,))
+        if self.state.shared:
+            self.state.incr("sessions:epoch")
+
+    def sweep(self, force=False):
+        """Delete expired sessions; rate limited unless force is set"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_seconds:
+                return 0
+            self._last_sweep = now
+            for token_hash in [key for key, entry in self._cache.items() if entry[2] <= now]:
+                del self._cache[token_hash]
+        return self.db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_sessions():
+    """Return the process-wide session store configured from settings"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = SessionStore(
+                db.get_db(),
+                ttl_seconds=settings.SESSION_TTL_DAYS * 86400,
+                cache_size=settings.SESSION_CACHE_SIZE,
+                sweep_seconds=settings.SESSION_SWEEP_SECONDS,
+                state=get_state()
+            )
+        return _default_store
@@ -0,0 +1,152 @@
+"""Deployment settings
+
+Every value can be overridden with an environment variable or a .env file
+next to app.py, so kiosks can be tuned without code changes.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite database shared by users, jobs and the other persistent tables
+DB_PATH = os.getenv("WEART_DB_PATH", "users.db")
+
+# Background generation workers
+JOB_WORKERS = int(os.getenv("WEART_JOB_WORKERS", "4"))
+
+# State that replicas must agree on (see state.py): "local" for a single
+# process, "sqlite" for several processes sharing WEART_DB_PATH
+STATE_BACKEND = os.getenv("WEART_STATE_BACKEND", "local")
+# With a shared backend every process heartbeats at this interval, and jobs of
+# a process that missed three heartbeats are taken over by the others
+REPLICA_HEARTBEAT_SECONDS = float(os.getenv("WEART_REPLICA_HEARTBEAT_SECONDS", "10"))
+
+# Prompt expansion cache
+PROMPT_CACHE_ENABLED = os.getenv("WEART_PROMPT_CACHE", "1") == "1"
+PROMPT_CACHE_TTL_HOURS = float(os.getenv("WEART_PROMPT_CACHE_TTL_HOURS", "168"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("WEART_PROMPT_CACHE_MAX_ENTRIES", "2000"))
+# Distinct prompts collected per combination before cached ones are reused
+PROMPT_CACHE_VARIANTS = int(os.getenv("WEART_PROMPT_CACHE_VARIANTS", "3"))
+
+# Prompt builder: "gpt" always asks GPT-4, "template" composes prompts locally,
+# "auto" asks GPT-4 but falls back to the local templates when it is slow or failing
+PROMPT_MODE = os.getenv("WEART_PROMPT_MODE", "auto")
+PROMPT_GPT_TIMEOUT = float(os.getenv("WEART_PROMPT_GPT_TIMEOUT", "8"))
+# Time allowed for one prompt expansion, retries included, in every mode
+PROMPT_DEADLINE_SECONDS = float(os.getenv("WEART_PROMPT_DEADLINE_SECONDS", "60"))
+# Chat model for the expansion, and the smaller one used while its circuit is
+# open (empty to go straight to the local templates)
+CHAT_MODEL = os.getenv("WEART_CHAT_MODEL", "gpt-4")
+CHAT_FALLBACK_MODEL = os.getenv("WEART_CHAT_FALLBACK_MODEL", "gpt-3.5-turbo")
+# Stream the GPT-4 expansion so the prompt appears on screen as it is written
+PROMPT_STREAM = os.getenv("WEART_PROMPT_STREAM", "1") == "1"
+PROMPT_STREAM_INTERVAL = float(os.getenv("WEART_PROMPT_STREAM_INTERVAL", "0.15"))
+
+# Shared OpenAI clients
+OPENAI_CLIENT_IDLE_SECONDS = float(os.getenv("WEART_OPENAI_CLIENT_IDLE_SECONDS", "900"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("WEART_OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("WEART_OPENAI_KEEPALIVE_SECONDS", "60"))
+
+# Local image store. It lives under ./static so Streamlit's static file serving
+# (server.enableStaticServing) can hand the renditions out directly; a store
+# moved elsewhere, e.g. for a load test, is not served.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_STORE_DIR = os.getenv("WEART_IMAGE_STORE_DIR") or os.path.join(APP_DIR, "static", "images")
+IMAGE_STATIC_PATH = "app/static/images"
+# Address phones can reach this host on, e.g. http://192.168.1.20:8501.
+# Without it QR codes keep pointing at the remote image URL.
+PUBLIC_BASE_URL = os.getenv("WEART_PUBLIC_BASE_URL", "").rstrip("/")
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("WEART_IMAGE_DOWNLOAD_TIMEOUT", "60"))
+
+# DALL-E tier per generation ("fast", "standard" or "hd", see IMAGE_TIERS in
+# generation.py). With an upgrade tier set, the first tier is a quick preview
+# and the upgrade is rendered in the background and swapped in when ready.
+IMAGE_TIER = os.getenv("WEART_IMAGE_TIER", "hd")
+IMAGE_UPGRADE_TIER = os.getenv("WEART_IMAGE_UPGRADE_TIER", "") or None
+IMAGE_UPGRADE_WORKERS = int(os.getenv("WEART_IMAGE_UPGRADE_WORKERS", "2"))
+# Time allowed for one image generation, retries included
+IMAGE_DEADLINE_SECONDS = float(os.getenv("WEART_IMAGE_DEADLINE_SECONDS", "90"))
+# Hedging (see hedging.py): an image call slower than this quantile of recent
+# calls of its tier gets a second request, with at most MAX_IN_FLIGHT at once
+IMAGE_HEDGE = os.getenv("WEART_IMAGE_HEDGE", "0") == "1"
+IMAGE_HEDGE_QUANTILE = float(os.getenv("WEART_IMAGE_HEDGE_QUANTILE", "0.9"))
+IMAGE_HEDGE_MIN_SAMPLES = int(os.getenv("WEART_IMAGE_HEDGE_MIN_SAMPLES", "20"))
+IMAGE_HEDGE_MAX_IN_FLIGHT = int(os.getenv("WEART_IMAGE_HEDGE_MAX_IN_FLIGHT", "2"))
+# Cheaper tiers tried in order while the circuit of the planned tier is open
+IMAGE_FALLBACK_TIERS = [
+    name.strip() for name in os.getenv("WEART_IMAGE_FALLBACK_TIERS", "standard,fast").split(",") if name.strip()
+]
+
+# Circuit breakers (see breaker.py), one per chat model and per image tier.
+# A call slower than the SLOW_SECONDS of its endpoint counts as failed.
+BREAKER_ENABLED = os.getenv("WEART_BREAKER", "1") == "1"
+BREAKER_WINDOW = int(os.getenv("WEART_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("WEART_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("WEART_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("WEART_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("WEART_BREAKER_HALF_OPEN_PROBES", "1"))
+BREAKER_CHAT_SLOW_SECONDS = float(os.getenv("WEART_BREAKER_CHAT_SLOW_SECONDS", "30"))
+BREAKER_IMAGE_SLOW_SECONDS = float(os.getenv("WEART_BREAKER_IMAGE_SLOW_SECONDS", "60"))
+
+# Idle-time pre-generation pool (see image_pool.py). Images are paid for with
+# the API key of WEART_POOL_USER; a budget of 0 switches the pool off.
+POOL_USER = os.getenv("WEART_POOL_USER", "")
+POOL_BUDGET_USD_PER_DAY = float(os.getenv("WEART_POOL_BUDGET_USD_PER_DAY", "0"))
+POOL_TOP_K = int(os.getenv("WEART_POOL_TOP_K", "10"))
+POOL_PER_COMBO = int(os.getenv("WEART_POOL_PER_COMBO", "2"))
+POOL_HALF_LIFE_HOURS = float(os.getenv("WEART_POOL_HALF_LIFE_HOURS", "24"))
+POOL_IDLE_SECONDS = float(os.getenv("WEART_POOL_IDLE_SECONDS", "60"))
+POOL_INTERVAL_SECONDS = float(os.getenv("WEART_POOL_INTERVAL_SECONDS", "30"))
+# TrueType font with Georgian glyphs for the name caption on pooled images
+CAPTION_FONT = os.getenv("WEART_CAPTION_FONT", "DejaVuSans.ttf")
+
+# Short link server for QR codes (0 disables it). LINK_BASE_URL is the address
+# phones reach it on, scheme and host only, e.g. http://192.168.1.20:8601;
+# without it QR codes encode the full image URL.
+LINK_PORT = int(os.getenv("WEART_LINK_PORT", "8601"))
+LINK_HOST = os.getenv("WEART_LINK_HOST", "0.0.0.0")
+LINK_BASE_URL = os.getenv("WEART_LINK_BASE_URL", "").rstrip("/")
+
+# Login sessions: the browser cookie only holds an opaque token, resolved
+# against the sessions table and an in-memory cache of active sessions
+SESSION_COOKIE = os.getenv("WEART_SESSION_COOKIE", "weart_session")
+SESSION_TTL_DAYS = float(os.getenv("WEART_SESSION_TTL_DAYS", "30"))
+SESSION_CACHE_SIZE = int(os.getenv("WEART_SESSION_CACHE_SIZE", "1024"))
+SESSION_SWEEP_SECONDS = float(os.getenv("WEART_SESSION_SWEEP_SECONDS", "3600"))
+
+# Gallery
+GALLERY_PAGE_SIZE = int(os.getenv("WEART_GALLERY_PAGE_SIZE", "12"))
+
+# SQLite connection pool
+DB_POOL_SIZE = int(os.getenv("WEART_DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("WEART_DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Coalescing of identical generation requests: "global" shares in-flight API calls
+# across all sessions, "user" only within one user's sessions, "off" disables it
+SINGLEFLIGHT_SCOPE = os.getenv("WEART_SINGLEFLIGHT_SCOPE", "global")
+
+# Speculative prompt expansion while the input form is being filled in (opt-in)
+PROMPT_PREFETCH = os.getenv("WEART_PROMPT_PREFETCH", "0") == "1"
+PROMPT_PREFETCH_DEBOUNCE = float(os.getenv("WEART_PROMPT_PREFETCH_DEBOUNCE", "1.5"))
+
+# Per-API-key request governor
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("WEART_RATE_LIMIT_CHAT_PER_MINUTE", "60"))
+RATE_LIMIT_IMAGES_PER_MINUTE = float(os.getenv("WEART_RATE_LIMIT_IMAGES_PER_MINUTE", "7"))
+MAX_CONCURRENT_CALLS_PER_KEY = int(os.getenv("WEART_MAX_CONCURRENT_CALLS_PER_KEY", "4"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("WEART_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("WEART_RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("WEART_RETRY_MAX_DELAY", "30"))
+
+# Alternative OpenAI-compatible endpoint, e.g. the local mock_openai.py server
+OPENAI_BASE_URL = os.getenv("WEART_OPENAI_BASE_URL") or None
+
+# Metrics: Prometheus text endpoint on localhost (0 disables it) and admin page access
+METRICS_PORT = int(os.getenv("WEART_METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("WEART_METRICS_HOST", "127.0.0.1")
+ADMIN_USERS = {name.strip() for name in os.getenv("WEART_ADMIN_USERS", "").split(",") if name.strip()}
+
+# QR codes: "svg" renders vector markup without PIL, "png" keeps a raster
+QR_FORMAT = os.getenv("WEART_QR_FORMAT", "svg").lower()
+QR_BOX_SIZE = int(os.getenv("WEART_QR_BOX_SIZE", "10"))
+QR_CACHE_SIZE = int(os.getenv("WEART_QR_CACHE_SIZE", "256"))
@@ -0,0 +1,160 @@
+"""Short links for QR codes
+
+Each generation gets its own 6-character id in the `short_links` table of users.db.
+QR codes then encode LINK_BASE_URL/I/<id> instead of a long signed image URL,
+which keeps them at a low QR version that phone cameras read quickly.
+
+The ids use only digits and upper-case letters and the link server resolves
+them case-insensitively. An all upper-case URL fits QR alphanumeric mode,
+which packs 5.5 bits per character instead of 8.
+
+A small HTTP server answers /i/<id>. It streams the locally stored download
+rendition when there is one, and otherwise redirects to the original URL.
+"""
+import logging
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import settings
+from . import db
+from .image_store import get_image_store
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ID_LENGTH = 6
+
+
+def new_link_id():
+    return "".join(secrets.choice(ID_ALPHABET) for _ in range(ID_LENGTH))
+
+
+class ShortLinks:
+    def __init__(self, db):
+        self.db = db
+
+    def create(self, image_id=None, target_url=None, attempts=5):
+        """Create a new link and return its id
+
+        Every job gets its own link, even when coalesced jobs share an image,
+        because retarget() moves one job's link to its upgraded image.
+        """
+        for _ in range(attempts):
+            link_id = new_link_id()
+            try:
+                self.db.execute(
+                    "INSERT INTO short_links (id, image_id, target_url) VALUES (?, ?, ?)",
+                    (link_id, image_id, target_url)
+                )
+                return link_id
+            except sqlite3.IntegrityError:
+                continue
+        raise RuntimeError("Could not allocate a free short link id")
+
+    def retarget(self, link_id, image_id, target_url):
+        """Point an existing link at another image; QR codes already shown keep working"""
+        self.db.execute(
+            "UPDATE short_links SET image_id = ?, target_url = ? WHERE id = ?",
+            (image_id, target_url, link_id)
+        )
+
+    def resolve(self, link_id):
+        """Look up a link and count the visit; None for unknown ids"""
+        link_id = link_id.upper()
+        row = self.db.query_one("SELECT * FROM short_links WHERE id = ?", (link_id,))
+        if row:
+            self.db.execute("UPDATE short_links SET hits = hits + 1 WHERE id = ?", (link_id,))
+        return row
+
+
+def short_url(link_id):
+    """Absolute short URL for QR codes, or None without LINK_BASE_URL"""
+    if not settings.LINK_BASE_URL:
+        return None
+    return f"{settings.LINK_BASE_URL}/i/{link_id}".upper()
+
+
+class _LinkHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 2 or parts[0].lower() != "i" or len(parts[1]) != ID_LENGTH:
+            self._not_found()
+            return
+        try:
+            link = get_short_links().resolve(parts[1])
+        except Exception as e:
+            logger.error(f"Short link lookup error: {str(e)}")
+            self.send_error(500)
+            return
+        if link is None:
+            self._not_found()
+            return
+
+        store = get_image_store()
+        if link['image_id'] and store.exists(link['image_id'], "download"):
+            REGISTRY.inc("weart_short_link_hits_total", served="local")
+            self._send_file(store.path(link['image_id'], "download"), f"weart-{link['id']}.jpg")
+        elif link['target_url']:
+            REGISTRY.inc("weart_short_link_hits_total", served="redirect")
+            self.send_response(302)
+            self.send_header("Location", link['target_url'])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._not_found()
+
+    def _send_file(self, path, filename):
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f'inline; filename="{filename}"')
+            self.send_header("Cache-Control", "public, max-age=86400, immutable")
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def _not_found(self):
+        REGISTRY.inc("weart_short_link_hits_total", served="missing")
+        self.send_error(404)
+
+
+def start_link_server(port, host="0.0.0.0"):
+    """Serve /i/<id> on a background thread; returns None if the port is taken"""
+    try:
+        server = ThreadingHTTPServer((host, port), _LinkHandler)
+    except OSError as e:
+        logger.error(f"Short link server not started on {host}:{port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="shortlinks").start()
+    logger.info(f"Short link server listening on http://{host}:{port}/i/")
+    return server
+
+
+_default_links = None
+_default_lock = threading.Lock()
+
+
+def get_short_links():
+    """Return the process-wide short link table configured from settings"""
+    global _default_links
+    with _default_lock:
+        if _default_links is None:
+            _default_links = ShortLinks(db.get_db())
+        return _default_links
+
+
+if __name__ == "__main__":
+    # Standalone mode, for running the link server next to the app as its own process
+    logging.basicConfig(level=logging.INFO)
+    server = start_link_server(settings.LINK_PORT or 8601, settings.LINK_HOST)
+    if server is not None:
+        threading.Event().wait()
@@ -0,0 +1,100 @@
+"""Coalescing of identical in-flight requests
+
+SingleFlight.do(key, fn) runs fn once per key at a time: callers that arrive
+while a call for the same key is running wait for it and share its result
+instead of issuing a duplicate paid API call.
+"""
+import hashlib
+import json
+import threading
+
+from . import settings
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        """Run fn for key, or wait for the identical call already running
+
+        Returns (result, shared) where shared tells whether the result came
+        from another caller's call.
+        """
+        with self._lock:
+            self._counters['calls'] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._counters['executed'] += 1
+                leader = True
+            else:
+                self._counters['coalesced'] += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def count_saved(self, n=1):
+        """Record calls saved outside do(), e.g. a duplicate job that was reused"""
+        with self._lock:
+            self._counters['calls'] += n
+            self._counters['coalesced'] += n
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls))
+
+
+def request_key(user_data, username=None):
+    """Key identical generation requests on their normalized user_data
+
+    username is mixed into the key when coalescing is scoped per user.
+    """
+    normalized = {
+        key: str(value).strip().lower() if isinstance(value, str) else value
+        for key, value in user_data.items()
+    }
+    normalized['age'] = int(normalized['age'])
+    if settings.SINGLEFLIGHT_SCOPE == "user":
+        normalized['_username'] = username
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_default_group = None
+_default_lock = threading.Lock()
+
+
+def get_singleflight():
+    """Return the process-wide group, or None when coalescing is switched off"""
+    global _default_group
+    if settings.SINGLEFLIGHT_SCOPE == "off":
+        return None
+    with _default_lock:
+        if _default_group is None:
+            _default_group = SingleFlight()
+        return _default_group
@@ -0,0 +1,142 @@
+"""Pluggable backend for short-lived state that replicas have to agree on
+
+Durable data (users, jobs, history, prompt cache, short links) already lives
+in users.db. What remained process-local is the fast-changing state around
+it: session revocations, job progress and live prompt text, rate limit
+buckets and the admin's image plan. Those go through a StateBackend chosen
+by WEART_STATE_BACKEND:
+
+* "local" keeps everything in this process, which is right for a single
+  Streamlit server and costs nothing.
+* "sqlite" keeps it in the `shared_state` table of users.db, so several
+  Streamlit processes pointed at the same WEART_DB_PATH (and the same
+  ./static directory for images) see one state and can sit behind a load
+  balancer. SQLite's WAL mode needs all processes on one host; spreading
+  over nodes needs a network store implementing the same five methods.
+
+Values must be JSON serializable. Keys may carry a ttl in seconds.
+"""
+import json
+import threading
+import time
+
+from . import db
+from . import settings
+
+
+class LocalState:
+    """In-process state; every process sees only its own"""
+
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+            return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.update(key, lambda value: ((value or 0) + amount,) * 2, ttl)
+
+    def update(self, key, fn, ttl=None):
+        """Atomically replace the value with fn(value)[0] and return fn(value)[1]"""
+        with self._lock:
+            now = time.time()
+            entry = self._live(key, now)
+            value, returned = fn(None if entry is None else entry[0])
+            self._values[key] = (value, now + ttl if ttl else None)
+            return returned
+
+
+class SQLiteState:
+    """State in users.db, shared by every process using the same database file"""
+
+    shared = True
+
+    def __init__(self, db, sweep_seconds=60):
+        self.db = db
+        self.sweep_seconds = sweep_seconds
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        with self._lock:
+            if now - self._last_sweep < self.sweep_seconds:
+                return
+            self._last_sweep = now
+        self.db.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def get(self, key, default=None):
+        row = self.db.query_one(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        )
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        self._sweep(now)
+        self.db.execute(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+        )
+
+    def delete(self, key):
+        self.db.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.update(key, lambda value: ((value or 0) + amount,) * 2, ttl)
+
+    def update(self, key, fn, ttl=None):
+        """Atomically replace the value with fn(value)[0] and return fn(value)[1]"""
+        now = time.time()
+        self._sweep(now)
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            value, returned = fn(None if row is None else json.loads(row[0]))
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+            )
+        return returned
+
+
+BACKENDS = {
+    "local": lambda: LocalState(),
+    "sqlite": lambda: SQLiteState(db.get_db()),
+}
+
+_default_state = None
+_default_lock = threading.Lock()
+
+
+def get_state():
+    """Return the process-wide state backend selected by settings.STATE_BACKEND"""
+    global _default_state
+    with _default_lock:
+        if _default_state is None:
+            if settings.STATE_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown state backend '{settings.STATE_BACKEND}'")
+            _default_state = BACKENDS[settings.STATE_BACKEND]()
+        return _default_state
@@ -0,0 +1,43 @@
+"""User accounts and their stored API keys"""
+import hashlib
+import sqlite3
+
+from .db import get_db
+from .metrics import timed
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def create_user(username, password, api_key):
+    """Register a user; False if the username is taken"""
+    try:
+        get_db().execute(
+            "INSERT INTO users (username, password_hash, api_key) VALUES (?, ?, ?)",
+            (username, hash_password(password), api_key)
+        )
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+
+@timed("verify_user")
+def authenticate(username, password):
+    """Return the user's API key if the password matches, otherwise None"""
+    result = get_db().query_one(
+        "SELECT password_hash, api_key FROM users WHERE username = ?",
+        (username,)
+    )
+    if result and result[0] == hash_password(password):
+        return result[1]
+    return None
+
+
+def get_user_api_key(username):
+    """Look up the stored API key of a user"""
+    result = get_db().query_one(
+        "SELECT api_key FROM users WHERE username = ?",
+        (username,)
+    )
+    return result[0] if result else None